@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+'''
+Batched show commands in a single channel round trip.
+
+send_batch writes "terminal length 0" and every show command in one write
+to the netmiko channel, reads until a prompt has come back for each of them
+and splits the combined output on the prompt lines:
+
+    terminal length 0
+    sw1#show version
+    ...
+    sw1#dir all-filesystems | include Directory of|bytes total
+    ...
+    sw1#
+
+Over a high latency link this costs one round trip per host instead of one
+per command. The result is {command: output}, the same text each command
+returns from netmiko_send_command.
+'''
+
+import re
+import time
+from nornir.core.task import Result
+
+
+PAGING_CMD = 'terminal length 0'
+
+
+# split combined output into per command output, the first line of each
+# segment is the command echo
+def split_output(text, prompt, commands):
+    segments = prompt.split(text.replace('\r\n', '\n').replace('\r', '\n'))
+    outputs = {}
+    for command, segment in zip(commands, segments):
+        lines = segment.split('\n')
+        outputs[command] = '\n'.join(lines[1:]).strip('\n')
+    return outputs
+
+
+# Nornir task, one write and one read loop for all commands
+def send_batch(task, commands, timeout=60, poll=0.1):
+    conn = task.host.get_connection("netmiko", task.nornir.config)
+    commands = [PAGING_CMD] + list(commands)
+    prompt = re.compile(rf'^{re.escape(conn.base_prompt)}[>#]', re.M)
+
+    conn.clear_buffer()
+    conn.write_channel(''.join(command + conn.RETURN for command in commands))
+
+    # one prompt after every command, the last one ends the batch
+    text = ''
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = conn.read_channel()
+        if not data:
+            time.sleep(poll)
+            continue
+        text += data
+        if len(prompt.findall(text)) >= len(commands) and \
+                prompt.search(text.rstrip().rsplit('\n', 1)[-1]):
+            break
+    else:
+        return Result(
+            host=task.host,
+            result=f'*** batch did not complete after {timeout} seconds ***\n{text}',
+            failed=True,
+        )
+
+    outputs = split_output(text, prompt, commands)
+    del outputs[PAGING_CMD]
+    return Result(host=task.host, result=outputs)
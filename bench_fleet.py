@@ -0,0 +1,438 @@
+#!/usr/bin/python3
+'''
+Fleet scale benchmark for the orchestration itself.
+
+Runs the real stack_upgrader.main() and check_version.main() flows against
+synthetic inventories of 10 to 5,000 hosts. The "netmiko" connection plugin
+is replaced by a mock that answers with canned raw show version / flash /
+install output after a configurable latency and jitter. Each size runs in
+its own process and reports wall-clock, CPU time and peak RSS per phase.
+
+The upgrade flow answers "y" to the upgrade prompt and "n" to the reload
+prompt, so the post-reload poller is not part of the benchmark.
+
+Usage:
+
+    python3 bench_fleet.py [--hosts 10 100 1000 5000] [--latency 0.05] [--jitter 0.02]
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import builtins
+import resource
+import tempfile
+import threading
+import subprocess
+import contextlib
+import yaml
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# canned device state per model, fields of the parsed show version
+MODELS = {
+    'C3750V2': {
+        'hardware': ['WS-C3750V2-24PS'],
+        'version': '12.2(55)SE11',
+        'running_image': 'c3750-ipbasek9-mz.122-55.SE11.bin',
+        'rommon': 'Bootstrap',
+        'config_register': '0xF',
+        'family': 'archive',
+        'flash': ['flash1', 'flash2'],
+    },
+    'C3750X': {
+        'hardware': ['WS-C3750X-24'],
+        'version': '15.2(4)E7',
+        'running_image': 'c3750e-universalk9-mz.152-4.E7.bin',
+        'rommon': 'Bootstrap',
+        'config_register': '0xF',
+        'family': 'archive',
+        'flash': ['flash1', 'flash2'],
+    },
+    'C3650': {
+        'hardware': ['WS-C3650-48PD'],
+        'version': '16.6.5',
+        'running_image': 'packages.conf',
+        'rommon': 'IOS-XE',
+        'config_register': '0x102',
+        'family': 'install',
+        'flash': ['flash-1', 'flash-2'],
+    },
+    'C9300': {
+        'hardware': ['C9300-48P'],
+        'version': '16.9.3',
+        'running_image': 'packages.conf',
+        'rommon': 'IOS-XE',
+        'config_register': '0x102',
+        'family': 'install',
+        'flash': ['flash-1', 'flash-2', 'flash-3'],
+    },
+}
+
+# group data as in inventory/sample_groups.yaml
+GROUP_DATA = {
+    'C3750V2': {
+        'upgrade_version': '12.2(55)SE12',
+        'upgrade_img': 'c3750-ipservicesk9-tar.122-55.SE12.tar',
+    },
+    'cat3750x': {
+        'upgrade_version': '15.2(4)E8',
+        'upgrade_img': 'c3750e-universalk9-tar.152-4.E8.tar',
+    },
+    'cat3650': {
+        'upgrade_version': '16.9.4',
+        'upgrade_img': 'cat3k_caa-universalk9.16.09.04.SPA.bin',
+    },
+    'cat9300': {
+        'upgrade_version': '16.9.4',
+        'upgrade_img': 'cat9k_iosxe.16.09.04.SPA.bin',
+    },
+}
+
+INSTALL_OUTPUT = {
+    'archive': [
+        'Loading {img} from {server} (via Vlan1): !!!!!!!!!!!!',
+        'examining image...',
+        'extracting info (109 bytes)',
+        'Installing (renaming): `flash1:update/{img}\' ->',
+        'New software image installed in flash1:/{img}',
+        'All software images installed.',
+    ],
+    'install': [
+        '--- Starting local lock acquisition on switch 1 ---',
+        'Finished local lock acquisition on switch 1',
+        'Expanding image file: {url}',
+        '[1]: Copying software from active switch 1 to switches 2',
+        '[1 2]: Finished copying software to switch',
+        'Verifying image file: {img}',
+        '[1 2]: Finished install successful on switch',
+        'SUCCESS: Software provisioned.  New software will load on reboot.',
+    ],
+}
+
+
+# raw show version, only the lines the parsers read
+SHOW_VERSION = '''\
+Cisco IOS Software, {family} Software, Version {version}, RELEASE SOFTWARE (fc2)
+{hostname} uptime is 4 weeks, 5 days, 23 hours, 14 minutes
+System image file is "flash:{running_image}"
+cisco {hardware} (PowerPC405) processor (revision W0) with 262144K bytes of memory.
+System serial number            : FDO0000X000
+Configuration register is {config_register}
+'''
+
+
+# Mock netmiko connection with latency and jitter per command
+class MockConnection(object):
+    RETURN = '\n'
+
+    def __init__(self, hostname, model, latency, jitter, md5s):
+        self.hostname = hostname
+        self.model = model
+        self.state = MODELS[model]
+        self.latency = latency
+        self.jitter = jitter
+        self.md5s = md5s
+        self.base_prompt = hostname
+        self.pending = []
+
+    def _wait(self):
+        time.sleep(max(0, random.gauss(self.latency, self.jitter)))
+
+    def show_version(self, use_textfsm=False):
+        if not use_textfsm:
+            return SHOW_VERSION.format(
+                hostname=self.hostname,
+                family=self.model,
+                version=self.state['version'],
+                running_image=self.state['running_image'],
+                hardware=self.state['hardware'][0],
+                config_register=self.state['config_register'],
+            )
+        return [{
+            'hostname': self.hostname,
+            'hardware': self.state['hardware'],
+            'version': self.state['version'],
+            'running_image': self.state['running_image'],
+            'rommon': self.state['rommon'],
+            'config_register': self.state['config_register'],
+            'uptime': '4 weeks, 5 days, 23 hours, 14 minutes',
+            'serial': ['FDO0000X000'],
+            'mac': ['00:00:00:00:00:00'],
+            'reload_reason': 'Reload Command',
+        }]
+
+    def flash(self):
+        lines = []
+        for fs in self.state['flash']:
+            lines.append(f'Directory of {fs}:/')
+            lines.append('  1621966848 bytes total (1089998848 bytes free)')
+        return '\n'.join(lines)
+
+    def send_command(self, command_string, use_textfsm=False, **kwargs):
+        self._wait()
+        return self._reply(command_string, use_textfsm)
+
+    def _reply(self, command_string, use_textfsm=False):
+        if command_string == 'show version':
+            return self.show_version(use_textfsm)
+        if command_string == 'show boot':
+            if not use_textfsm:
+                return f"BOOT path-list      : flash:/{self.state['running_image']}"
+            return [{'boot_path': f"flash:/{self.state['running_image']}"}]
+        if command_string.startswith('dir all-filesystems') or \
+                command_string.startswith('show flash'):
+            return self.flash()
+        if command_string.startswith('dir flash:'):
+            name = command_string.split(':', 1)[1]
+            return f'Directory of flash:/{name}\n  1  -rw-  1000  {name}'
+        if command_string.startswith('verify /md5 '):
+            fs, name = command_string.split()[-1].split(':', 1)
+            return f'verify /md5 ({fs}:{name}) = {self.md5s.get(name)}'
+        return ''
+
+    def send_command_timing(self, command_string, **kwargs):
+        self._wait()
+        if command_string == 'reload':
+            return 'Proceed with reload? [confirm]'
+        return ''
+
+    def save_config(self, *args, **kwargs):
+        self._wait()
+        return 'Building configuration...\n[OK]'
+
+    def find_prompt(self):
+        return f'{self.hostname}#'
+
+    def clear_buffer(self):
+        self.pending = []
+
+    # queue canned install output for the written command
+    def write_channel(self, data):
+        cmd = data.strip()
+        if cmd.startswith('archive download-sw') or \
+                cmd.startswith('request platform software package install'):
+            url = [t for t in cmd.split() if ':' in t][-1]
+            img = url.split('/')[-1].split(':')[-1]
+            server = url.split('/')[2] if '://' in url else 'flash'
+            family = 'archive' if cmd.startswith('archive') else 'install'
+            self.pending = [line.format(img=img, url=url, server=server) + '\n'
+                            for line in INSTALL_OUTPUT[family]]
+            self.pending.append(f'{self.hostname}#')
+        elif cmd.startswith('copy '):
+            url, dest = cmd.split()[1:3]
+            self.pending = [f'Accessing {url}...\n', f'Loading {url} !!!!!!!!\n',
+                            f'[OK - 1000 bytes]\n', '1000 bytes copied in 1.000 secs\n',
+                            f'{self.hostname}#']
+        elif '\n' in data.strip():
+            # batched show commands, echo, output and prompt per command
+            replies = [f'{cmd}\n{self._reply(cmd)}\n{self.hostname}#'
+                       for cmd in data.strip().split('\n')]
+            self.pending = [''.join(replies)]
+
+    def read_channel(self):
+        if not self.pending:
+            return ''
+        self._wait()
+        return self.pending.pop(0)
+
+    def disconnect(self):
+        pass
+
+
+# swap the netmiko connection plugin for the mock after InitNornir
+def install_mock(module, latency, jitter, md5s):
+    from nornir.core.connections import ConnectionPlugin, Connections
+
+    class MockNetmiko(ConnectionPlugin):
+        def open(self, hostname, username, password, port, platform,
+                 extras=None, configuration=None):
+            model = (extras or {}).get('model') or 'C3750X'
+            self.connection = MockConnection(hostname, model, latency, jitter, md5s)
+
+        def close(self):
+            self.connection.disconnect()
+
+    real_init = module.InitNornir
+
+    def init_nornir(*args, **kwargs):
+        # InitNornir registers the real netmiko plugin again
+        Connections.available.pop('netmiko', None)
+        nr = real_init(*args, **kwargs)
+        Connections.available['netmiko'] = MockNetmiko
+        return nr
+
+    module.InitNornir = init_nornir
+
+
+# synthetic inventory, model passed to the mock through netmiko extras
+def write_inventory(directory, hosts, platform, prefix=''):
+    models = list(MODELS)
+    inventory = {}
+    for i in range(hosts):
+        model = models[i % len(models)]
+        inventory[f'sw{i:05d}'] = {
+            'hostname': f'sw{i:05d}',
+            'groups': ['switches'],
+            'data': {'site': f'site{i % 10}'},
+            'connection_options': {'netmiko': {'extras': {'model': model}}},
+        }
+    groups = {
+        'switches': {
+            'platform': platform,
+            'port': 22,
+            'data': dict(GROUP_DATA, ftp_ip='10.0.0.1'),
+        },
+    }
+    defaults = {
+        'username': 'admin',
+        'password': 'cisco',
+        'data': {
+            'image_dir': os.path.join(directory, 'images'),
+            'scheduler': {'max_workers': 50, 'server_cons': 50, 'site_mbps': 1000},
+        },
+    }
+    os.makedirs(os.path.join(directory, 'inventory'), exist_ok=True)
+    with open(os.path.join(directory, f'{prefix}hosts.yaml'), 'w') as f:
+        yaml.safe_dump(inventory, f)
+    with open(os.path.join(directory, f'{prefix}groups.yaml'), 'w') as f:
+        yaml.safe_dump(groups, f)
+    with open(os.path.join(directory, f'{prefix}defaults.yaml'), 'w') as f:
+        yaml.safe_dump(defaults, f)
+
+
+# small stand-in images so the catalog and flash checks have sizes
+def write_images(directory):
+    os.makedirs(os.path.join(directory, 'images'), exist_ok=True)
+    for data in GROUP_DATA.values():
+        with open(os.path.join(directory, 'images', data['upgrade_img']), 'wb') as f:
+            f.write(os.urandom(4096))
+
+
+# wall-clock, CPU and peak RSS spans per Nornir task name
+class PhaseProbe(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+
+    def wrap(self, nornir_cls):
+        real_run = nornir_cls.run
+        probe = self
+
+        def run(nr, task, *args, **kwargs):
+            started = (time.perf_counter(), time.process_time())
+            try:
+                return real_run(nr, task, *args, **kwargs)
+            finally:
+                probe.add(task.__name__, started)
+
+        nornir_cls.run = run
+
+    def add(self, name, started):
+        ended = (time.perf_counter(), time.process_time())
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        with self.lock:
+            phase = self.phases.setdefault(name, {
+                'start': started, 'end': ended, 'rss_kb': rss})
+            phase['start'] = min(phase['start'], started)
+            phase['end'] = max(phase['end'], ended)
+            phase['rss_kb'] = max(phase['rss_kb'], rss)
+
+    def report(self):
+        return {
+            name: {
+                'wall': p['end'][0] - p['start'][0],
+                'cpu': p['end'][1] - p['start'][1],
+                'rss_mb': p['rss_kb'] / 1024,
+            }
+            for name, p in self.phases.items()
+        }
+
+
+# run one flow for one fleet size inside this process
+def run_once(flow, hosts, latency, jitter):
+    from nornir.core import Nornir
+    import stack_upgrader
+    import check_version
+    from image_catalog import ImageCatalog
+
+    directory = tempfile.mkdtemp(prefix='bench_fleet_')
+    os.chdir(directory)
+    write_images(directory)
+    md5s = {name: image['md5'] for name, image in
+            ImageCatalog(os.path.join(directory, 'images')).images.items()}
+
+    probe = PhaseProbe()
+    probe.wrap(Nornir)
+
+    if flow == 'upgrade':
+        write_inventory(directory, hosts, 'ios', prefix='inventory/bench_')
+        # kickoff loads inventory/defaults.yaml for every site
+        os.replace(os.path.join(directory, 'inventory/bench_defaults.yaml'),
+                   os.path.join(directory, 'inventory/defaults.yaml'))
+        install_mock(stack_upgrader, latency, jitter, md5s)
+        sys.argv = ['stack_upgrader.py', 'bench']
+        answers = iter(['y', 'n'])
+        entry = stack_upgrader.main
+    else:
+        write_inventory(directory, hosts, 'cisco_ios')
+        install_mock(check_version, latency, jitter, md5s)
+        sys.argv = ['check_version.py']
+        answers = iter([])
+        entry = check_version.main
+
+    builtins.input = lambda prompt='': next(answers, 'n')
+    started = (time.perf_counter(), time.process_time())
+    # printing is part of the cost, send it to /dev/null
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        try:
+            entry()
+        except SystemExit:
+            # "n" at the reload prompt exits the script
+            pass
+    probe.add('total', started)
+    return probe.report()
+
+
+# run every size in its own process for clean peak RSS numbers
+def main():
+    parser = argparse.ArgumentParser(description='Fleet scale orchestration benchmark')
+    parser.add_argument('--hosts', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--flows', nargs='+', default=['check', 'upgrade'],
+        choices=['check', 'upgrade'])
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--child', nargs=2, metavar=('FLOW', 'HOSTS'),
+        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, HERE)
+        report = run_once(args.child[0], int(args.child[1]), args.latency, args.jitter)
+        print(json.dumps(report))
+        return
+
+    print(f"{'flow':<9}{'hosts':>7}  {'phase':<24}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}")
+    for flow in args.flows:
+        for hosts in args.hosts:
+            out = subprocess.run(
+                [sys.executable, os.path.join(HERE, 'bench_fleet.py'),
+                 '--latency', str(args.latency), '--jitter', str(args.jitter),
+                 '--child', flow, str(hosts)],
+                capture_output=True, text=True,
+            )
+            if out.returncode != 0:
+                print(f"{flow:<9}{hosts:>7}  failed: {out.stderr.strip().splitlines()[-1:]}")
+                continue
+            report = json.loads(out.stdout.strip().splitlines()[-1])
+            for phase, p in sorted(report.items(), key=lambda kv: kv[0] == 'total'):
+                print(f"{flow:<9}{hosts:>7}  {phase:<24}{p['wall']:>10.2f}" +
+                      f"{p['cpu']:>10.2f}{p['rss_mb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+'''
+Local load test for ftp_server.py.
+
+Starts ftp_server.py in production mode against a temporary image directory
+and downloads the same image with many concurrent ftplib clients, then
+reports aggregate throughput, per-client times and failed downloads.
+
+Usage:
+
+    python3 bench_ftp_server.py [--clients 50 200] [--size-mb 32] [--workers 4]
+'''
+
+import os
+import sys
+import time
+import signal
+import ftplib
+import socket
+import argparse
+import tempfile
+import subprocess
+import threading
+import yaml
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+# free local TCP port
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# wait for the server to accept connections
+def wait_for(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'FTP server did not start on port {port}')
+
+
+# download the image once, returns seconds taken and bytes received
+def download(port, name):
+    received = [0]
+
+    def _count(buf):
+        received[0] += len(buf)
+
+    started = time.perf_counter()
+    ftp = ftplib.FTP()
+    ftp.connect('127.0.0.1', port, timeout=120)
+    ftp.login()
+    ftp.retrbinary(f'RETR {name}', _count, blocksize=1024 * 1024)
+    ftp.quit()
+    return time.perf_counter() - started, received[0]
+
+
+# run N clients at once
+def run_clients(port, name, clients, size):
+    times = []
+    errors = []
+
+    def _client():
+        try:
+            seconds, received = download(port, name)
+            if received != size:
+                errors.append('short read')
+            times.append(seconds)
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=_client) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    rate = len(times) * size / elapsed / 1024 / 1024
+    return rate, sorted(times), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FTP image server load test')
+    parser.add_argument('--clients', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--size-mb', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        name = 'cat9k_iosxe.bench.SPA.bin'
+        size = args.size_mb * 1024 * 1024
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(os.urandom(size))
+
+        # every client comes from 127.0.0.1, so lift the per-ip limit
+        port = free_port()
+        config = os.path.join(directory, 'ftp_server.yaml')
+        with open(config, 'w') as f:
+            yaml.safe_dump({
+                'port': port,
+                'root': directory,
+                'max_cons': max(args.clients) + 16,
+                'max_cons_per_ip': max(args.clients) + 16,
+                'workers': args.workers,
+                'transfer_log': os.path.join(directory, 'transfers.log'),
+            }, f)
+
+        server = subprocess.Popen(
+            [sys.executable, 'ftp_server.py', '--config', config, '--production'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # own process group so the forked workers are stopped too
+            start_new_session=True,
+        )
+        try:
+            wait_for(port)
+            c_print(f'{args.size_mb} MB image, production mode')
+            print(f"{'clients':>8}{'MB/s':>10}{'p50 s':>10}{'max s':>10}{'errors':>8}")
+            for clients in args.clients:
+                rate, times, errors = run_clients(port, name, clients, size)
+                p50 = times[len(times) // 2] if times else 0
+                slowest = times[-1] if times else 0
+                print(f"{clients:>8}{rate:>10.0f}{p50:>10.2f}{slowest:>10.2f}{len(errors):>8}")
+
+            # per transfer lines written by the server
+            with open(os.path.join(directory, 'transfers.log')) as f:
+                logged = len(f.readlines())
+            c_print(f'{logged} transfers logged by the server')
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+    print('~'*80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+'''
+Benchmark aggregate image server throughput with N concurrent clients on
+localhost, comparing the old single-request TCPServer with ImageHTTPServer.
+
+Usage:
+
+    python3 bench_image_server.py [--clients 1 8 32] [--size-mb 64]
+'''
+
+import os
+import time
+import argparse
+import tempfile
+import threading
+import http.client
+import socketserver
+from functools import partial
+from http.server import SimpleHTTPRequestHandler
+from image_server import ImageHTTPServer
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+# quiet stock handler, as served by the old ThreadedHTTPServer
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# download a file once, returns bytes received
+def download(port, name, start=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    headers = {'Range': f'bytes={start}-'} if start is not None else {}
+    conn.request('GET', f'/{name}', headers=headers)
+    resp = conn.getresponse()
+    received = 0
+    while True:
+        buf = resp.read(1024 * 1024)
+        if not buf:
+            break
+        received += len(buf)
+    conn.close()
+    return received
+
+
+# run N clients at once against a server, returns MB/s
+def run_clients(port, name, clients, size):
+    errors = []
+
+    def _client():
+        try:
+            if download(port, name) != size:
+                errors.append('short read')
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=_client) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        print(f"{' ' *4}{len(errors)} client errors, e.g. {errors[0]}")
+    return clients * size / elapsed / 1024 / 1024
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Image server throughput benchmark')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--size-mb', type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        name = 'cat9k_iosxe.bench.SPA.bin'
+        size = args.size_mb * 1024 * 1024
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(os.urandom(size))
+
+        old = serve(socketserver.TCPServer(
+            ('127.0.0.1', 0), partial(QuietHandler, directory=directory)))
+        new = serve(ImageHTTPServer(
+            ('127.0.0.1', 0), directory, max_clients=max(args.clients)))
+
+        # resumed download only sends the missing tail
+        tail = download(new.server_address[1], name, start=size // 2)
+        assert tail == size - size // 2, f'range request returned {tail} bytes'
+
+        c_print(f'{args.size_mb} MB image, aggregate MB/s')
+        print(f"{'clients':>8}{'TCPServer':>14}{'ImageHTTPServer':>18}")
+        for clients in args.clients:
+            old_rate = run_clients(old.server_address[1], name, clients, size)
+            new_rate = run_clients(new.server_address[1], name, clients, size)
+            print(f"{clients:>8}{old_rate:>14.0f}{new_rate:>18.0f}")
+
+        for server in (old, new):
+            server.shutdown()
+            server.server_close()
+    print('~'*80)
+
+
+if __name__ == "__main__":
+    main()
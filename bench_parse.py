@@ -0,0 +1,295 @@
+#!/usr/bin/python3
+'''
+Micro-benchmark of the fast show version / show boot parser against TextFSM.
+
+The samples are the raw outputs behind the parsed results kept in
+old_stack_upgrader_scp.ver_output(): ISE_3650 (IOS-XE 16.9.4),
+ISE_3750 (IOS 12.2(55)SE12) and ISE_3750X (IOS 15.2(4)E8). The fast parser
+is checked against the expected fields first, then both parsers are timed.
+TextFSM is skipped when textfsm / ntc-templates are not installed.
+
+Usage:
+
+    python3 bench_parse.py [--rounds 2000]
+'''
+
+import time
+import argparse
+from show_parser import parse_show_version, parse_show_boot, parse_textfsm
+
+
+SHOW_VERSION = {
+    'ISE_3650': '''\
+Cisco IOS XE Software, Version 16.09.04
+Cisco IOS Software [Fuji], Catalyst L3 Switch Software (CAT3K_CAA-UNIVERSALK9-M), Version 16.9.4, RELEASE SOFTWARE (fc2)
+Technical Support: http://www.cisco.com/techsupport
+Copyright (c) 1986-2019 by Cisco Systems, Inc.
+Compiled Thu 22-Aug-19 18:14 by mcpre
+
+
+Cisco IOS-XE software, Copyright (c) 2005-2019 by cisco Systems, Inc.
+All rights reserved.  Certain components of Cisco IOS-XE software are
+licensed under the GNU General Public License ("GPL") Version 2.0.
+
+
+ROM: IOS-XE ROMMON
+BOOTLDR: CAT3K_CAA Boot Loader (CAT3K_CAA-HBOOT-M) Version 4.58, RELEASE SOFTWARE (P)
+
+ISE_3650 uptime is 4 weeks, 5 days, 23 hours, 14 minutes
+Uptime for this control processor is 4 weeks, 5 days, 23 hours, 17 minutes
+System returned to ROM by Reload Command
+System image file is "flash:packages.conf"
+Last reload reason: Reload Command
+
+
+Technology Package License Information:
+
+-----------------------------------------------------------------
+Technology-package                   Technology-package
+Current             Type             Next reboot
+------------------------------------------------------------------
+ipbasek9            Smart License    ipbasek9
+None                Subscription Smart License    None
+
+
+Smart Licensing Status: UNREGISTERED/EVAL EXPIRED
+
+cisco WS-C3650-48PD (MIPS) processor (revision N0) with 838332K/6147K bytes of memory.
+Processor board ID FDO2129Q2N8
+2 Virtual Ethernet interfaces
+52 Gigabit Ethernet interfaces
+2 Ten Gigabit Ethernet interfaces
+2048K bytes of non-volatile configuration memory.
+4194304K bytes of physical memory.
+252000K bytes of Crash Files at crashinfo:.
+1611414K bytes of Flash at flash:.
+0K bytes of WebUI ODM Files at webui:.
+
+Base Ethernet MAC Address          : 38:90:a5:67:5f:00
+Motherboard Assembly Number        : 73-15899-06
+Motherboard Serial Number          : FDO21290HZB
+Model Revision Number              : N0
+Motherboard Revision Number        : A0
+Model Number                       : WS-C3650-48PD
+System Serial Number               : FDO2129Q2N8
+
+
+Switch Ports Model              SW Version        SW Image              Mode
+------ ----- -----              ----------        ----------            ----
+*    1 52    WS-C3650-48PD      16.9.4            CAT3K_CAA-UNIVERSALK9 INSTALL
+
+
+Configuration register is 0x102
+''',
+    'ISE_3750': '''\
+Cisco IOS Software, C3750 Software (C3750-IPBASEK9-M), Version 12.2(55)SE12, RELEASE SOFTWARE (fc2)
+Technical Support: http://www.cisco.com/techsupport
+Copyright (c) 1986-2017 by Cisco Systems, Inc.
+Compiled Tue 28-Feb-17 09:56 by prod_rel_team
+Image text-base: 0x01000000, data-base: 0x02F00000
+
+ROM: Bootstrap program is C3750 boot loader
+BOOTLDR: C3750 Boot Loader (C3750-HBOOT-M) Version 12.2(44)SE5, RELEASE SOFTWARE (fc1)
+
+ISE_3750 uptime is 1 week, 2 days, 20 hours, 37 minutes
+System returned to ROM by power-on
+System image file is "flash:c3750-ipbasek9-mz.122-55.SE12.bin"
+
+
+This product contains cryptographic features and is subject to United
+States and local country laws governing import, export, transfer and
+use.
+
+cisco WS-C3750V2-24PS (PowerPC405) processor (revision H0) with 131072K bytes of memory.
+Processor board ID FDO1436V27C
+Last reset from power-on
+1 Virtual Ethernet interface
+24 FastEthernet interfaces
+2 Gigabit Ethernet interfaces
+The password-recovery mechanism is enabled.
+
+512K bytes of flash-simulated non-volatile configuration memory.
+Base ethernet MAC Address       : B4:A4:E3:DE:FB:80
+Motherboard assembly number     : 73-11473-07
+Power supply part number        : 341-0266-02
+Motherboard serial number       : FDO14360KEV
+Power supply serial number      : DCA1432G0BZ
+Model revision number           : H0
+Motherboard revision number     : A0
+Model number                    : WS-C3750V2-24PS-S
+System serial number            : FDO1436V27C
+Top Assembly Part Number        : 800-31165-03
+Top Assembly Revision Number    : A0
+Version ID                      : V08
+CLEI Code Number                : COMDF10BRA
+Hardware Board Revision Number  : 0x01
+
+
+Switch Ports Model              SW Version            SW Image
+------ ----- -----              ----------            ----------
+*    1 26    WS-C3750V2-24PS    12.2(55)SE12          C3750-IPBASEK9-M
+
+
+Configuration register is 0xF
+''',
+    'ISE_3750X': '''\
+Cisco IOS Software, C3750E Software (C3750E-UNIVERSALK9-M), Version 15.2(4)E8, RELEASE SOFTWARE (fc4)
+Technical Support: http://www.cisco.com/techsupport
+Copyright (c) 1986-2019 by Cisco Systems, Inc.
+Compiled Thu 14-Mar-19 05:25 by prod_rel_team
+
+ROM: Bootstrap program is C3750E boot loader
+BOOTLDR: C3750E Boot Loader (C3750X-HBOOT-M) Version 15.2(3r)E, RELEASE SOFTWARE (fc1)
+
+ISE_3750X uptime is 4 weeks, 6 days, 19 hours, 27 minutes
+System returned to ROM by Reload command
+System image file is "flash:c3750e-universalk9-mz.152-4.E8.bin"
+
+
+License Level: ipbase
+License Type: Permanent Right-To-Use
+Next reload license Level: ipbase
+
+cisco WS-C3750X-24 (PowerPC405) processor (revision W0) with 262144K bytes of memory.
+Processor board ID FDO1720H3EZ
+Last reset from power-on
+1 Virtual Ethernet interface
+1 FastEthernet interface
+28 Gigabit Ethernet interfaces
+2 Ten Gigabit Ethernet interfaces
+The password-recovery mechanism is enabled.
+
+512K bytes of flash-simulated non-volatile configuration memory.
+Base ethernet MAC Address       : F8:72:EA:A5:47:00
+Motherboard assembly number     : 73-12554-13
+Motherboard serial number       : FDO17200G6Y
+Model revision number           : W0
+Motherboard revision number     : A0
+Model number                    : WS-C3750X-24
+System serial number            : FDO1720H3EZ
+
+
+Switch Ports Model              SW Version            SW Image
+------ ----- -----              ----------            ----------
+*    1 30    WS-C3750X-24       15.2(4)E8             C3750E-UNIVERSALK9-M
+
+
+Configuration register is 0xF
+''',
+}
+
+SHOW_BOOT = {
+    'ISE_3650': '''\
+---------------------------
+Switch 1
+---------------------------
+Current Boot Variables:
+BOOT variable = flash:packages.conf;
+
+Boot Variables on next reload:
+BOOT variable = flash:packages.conf;
+Manual Boot = no
+Enable Break = no
+Boot Mode = DEVICE
+iPXE Timeout = 0
+''',
+    'ISE_3750': '''\
+BOOT path-list      : flash:c3750-ipbasek9-mz.122-55.SE12.bin
+Config file         : flash:/config.text
+Private Config file : flash:/private-config.text
+Enable Break        : no
+Manual Boot         : no
+HELPER path-list    :
+Auto upgrade        : yes
+Auto upgrade path   :
+NVRAM/Config file
+      buffer size:   524288
+Timeout for Config
+          Download:    0 seconds
+Config Download
+       via DHCP:       disabled (next boot: disabled)
+''',
+    'ISE_3750X': '''\
+BOOT path-list      : flash:/c3750e-universalk9-mz.152-4.E8/c3750e-universalk9-mz.152-4.E8.bin
+Config file         : flash:/config.text
+Private Config file : flash:/private-config.text
+Enable Break        : no
+Manual Boot         : no
+Allow Dev Key         : yes
+HELPER path-list    :
+Auto upgrade        : yes
+Auto upgrade path   :
+Boot optimization   : disabled
+NVRAM/Config file
+      buffer size:   524288
+Timeout for Config
+          Download:    0 seconds
+Config Download
+       via DHCP:       disabled (next boot: disabled)
+''',
+}
+
+# fields from old_stack_upgrader_scp.ver_output() that the scripts use
+EXPECTED = {
+    'ISE_3650': {'version': '16.9.4', 'hardware': 'WS-C3650-48PD',
+                 'running_image': 'packages.conf'},
+    'ISE_3750': {'version': '12.2(55)SE12', 'hardware': 'WS-C3750V2-24PS',
+                 'running_image': 'c3750-ipbasek9-mz.122-55.SE12.bin'},
+    'ISE_3750X': {'version': '15.2(4)E8', 'hardware': 'WS-C3750X-24',
+                  'running_image': 'c3750e-universalk9-mz.152-4.E8.bin'},
+}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Benchmark show version parsing')
+    parser.add_argument('--rounds', type=int, default=2000,
+        help='parses per sample and parser')
+    return parser.parse_args()
+
+
+# fast parser must agree with the fields textfsm returns for the samples
+def check():
+    for name, expected in EXPECTED.items():
+        parsed = parse_show_version(SHOW_VERSION[name])[0]
+        hardware = parsed['hardware'][0]
+        assert parsed['version'] == expected['version'], (name, parsed['version'])
+        assert hardware == expected['hardware'], (name, hardware)
+        assert parsed['running_image'] == expected['running_image'], name
+        assert parsed['hostname'] == name, name
+        assert parse_show_boot(SHOW_BOOT[name]), name
+        print(f"{name:<12}{parsed['version']:<16}{hardware:<20}{parsed['running_image']}")
+
+
+# microseconds per parse of every sample
+def timed(parse, samples, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for output in samples:
+            parse(output)
+    return (time.perf_counter() - started) / (rounds * len(samples)) * 1e6
+
+
+def main():
+    args = get_args()
+    check()
+    print()
+
+    rows = [
+        ('fast show version', timed(parse_show_version, SHOW_VERSION.values(), args.rounds)),
+        ('fast show boot', timed(parse_show_boot, SHOW_BOOT.values(), args.rounds)),
+    ]
+    try:
+        rows.append(('textfsm show version', timed(
+            lambda o: parse_textfsm(o, 'show version'), SHOW_VERSION.values(), args.rounds)))
+        rows.append(('textfsm show boot', timed(
+            lambda o: parse_textfsm(o, 'show boot'), SHOW_BOOT.values(), args.rounds)))
+    except ImportError:
+        print('textfsm / ntc-templates not installed, TextFSM skipped\n')
+
+    print(f"{'parser':<24}{'us / parse':>12}")
+    for name, us in rows:
+        print(f"{name:<24}{us:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,10 +21,22 @@ C9300:
 '''
 
 import os, sys
+import argparse
 from getpass import getpass
 from nornir import InitNornir
 from nornir.plugins.tasks.networking import netmiko_send_command
 from nornir.plugins.tasks.networking import netmiko_save_config
+from facts_cache import FactsCache
+from plan import model_data
+from metrics import PhaseTimer, METRICS_FILE
+from show_parser import parse_output
+from batch_show import send_batch
+from versions import classify
+from install_state import INSTALL_CMDS, is_xe, batch_pending, flag_pending
+
+
+# Host facts kept in the facts cache
+FACT_KEYS = ['sh_version', 'current_version', 'sw_model', 'sh_boot', 'pending_version']
 
 
 # Print formatting function
@@ -33,6 +45,17 @@ def c_print(printme):
     print(f"\n" + printme.center(80, ' ') + "\n")
 
 
+# command line options
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Verify software version on Cisco Catalyst switch stacks')
+    parser.add_argument('--max-age', type=float, default=None,
+        help='use cached facts younger than this many minutes')
+    parser.add_argument('--metrics', default=METRICS_FILE,
+        help='JSON lines file for per host phase timings')
+    return parser.parse_args()
+
+
 # Set device credentials
 def kickoff(norn, username=None, password=None):
     # print banner
@@ -52,52 +75,64 @@ def kickoff(norn, username=None, password=None):
 
 
 # Run show commands on each switch
-def get_info(task):
+def get_info(task, cache=None, max_age=None):
+    # answer from the facts cache when it is fresh enough
+    if cache and max_age is not None and \
+            cache.restore(task.host, FACT_KEYS, max_age):
+        print(f"{' ' *10}*** {task.host}: using cached facts ***")
+        return
+
     c_print(f'*** {task.host}: running show comands ***')
-    # run "show version" on each host
-    sh_version = task.run(
-        task=netmiko_send_command,
-        command_string="show version",
-        use_textfsm=True,
+    # run "show version", "show boot" and the install state in one round trip
+    shows = task.run(
+        task=send_batch,
+        commands=["show version"] + INSTALL_CMDS,
     )
+    outputs = shows.result
 
     # save show version output to task.host
-    task.host['sh_version'] = sh_version.result[0]
+    task.host['sh_version'] = parse_output(outputs["show version"], "show version")[0]
     # pull version from show version
     task.host['current_version'] = task.host['sh_version']['version']
 
-    # pull model from show version
+    # pull model from show version, WS-C3850-48P or C9300-48P
     sw_model = task.host['sh_version']['hardware'][0].split("-")
-    sw_model = sw_model[1]
+    sw_model = sw_model[1] if sw_model[0] == 'WS' else sw_model[0]
     task.host['sw_model'] = sw_model
 
-    # run "show boot" on each host
-    sh_boot = task.run(
-        task=netmiko_send_command,
-        command_string="show boot",
-        use_textfsm=True,
-    )
     # save show boot version output to task.host
-    task.host['sh_boot'] = sh_boot.result[0]['boot_path'].split("/")[-1]
+    sh_boot = parse_output(outputs["show boot"], "show boot")
+    task.host['sh_boot'] = sh_boot[0]['boot_path'].split("/")[-1]
+    # IOS-XE release installed and waiting for a reload
+    task.host['pending_version'] = batch_pending(
+        sw_model, outputs, task.host['current_version'])
+
+    # save facts for later runs
+    if cache:
+        cache.store(task.host, FACT_KEYS)
 
 
 # Compare current and desired software version
 def check_ver(task):
     sw_model = task.host['sw_model']
     # upgraded image to be used
-    desired = task.host[sw_model]['upgrade_version']
+    desired = model_data(task.host, sw_model)['upgrade_version']
     # record current software version
     current = task.host['current_version']
 
-    upgrade_img = task.host[sw_model]['upgrade_img']
+    upgrade_img = model_data(task.host, sw_model)['upgrade_img']
 
-    # compare current with desired version
-    if current == desired:
+    # compare current with desired version, newer releases are left alone
+    action = classify(current, desired, bool(task.host.get('allow_downgrade')))
+    if action == 'equal':
         print(f"{' ' *10}*** {task.host}: running {current} upgrade NOT needed ***")
         # set host upgrade flag to False
         task.host['upgrade'] = False
+    elif action == 'newer':
+        print(f"{' ' *10}*** {task.host}: running {current} newer than {desired}, skipped ***")
+        task.host['upgrade'] = False
     else:
-        print(f"{' ' *10}*** {task.host}: running {current} must be upgraded ***")
+        print(f"{' ' *10}*** {task.host}: running {current} must be {action}d ***")
         # set host upgrade flag to True
         task.host['upgrade'] = True
 
@@ -109,8 +144,10 @@ def check_ver(task):
             if boot_ver == upgrade_ver:
                 print(f"{' ' *10}*** {task.host}: will be upgraded to {desired} on next reboot ***")
 
-        elif '3650' in sw_model or '3850' in sw_model:
-            _stuff = None
+        elif is_xe(sw_model):
+            # installed and activated, only waiting for a reload
+            if flag_pending(task.host, desired):
+                print(f"{' ' *10}*** {task.host}: will be upgraded to {desired} on next reboot ***")
 
 
 # Stack upgrader main function
@@ -184,18 +221,26 @@ def reload_sw(task):
 
 
 def main():
-  
+
+    args = get_args()
+    # facts cache, --max-age is given in minutes
+    cache = FactsCache()
+    max_age = args.max_age * 60 if args.max_age is not None else None
+
     # initialize The Norn
     nr = InitNornir()
     # filter The Norn
     nr = nr.filter(platform="cisco_ios")
+    # time every task and subtask per host
+    nr = nr.with_processors([PhaseTimer(args.metrics)])
     # run The Norn kickoff
     kickoff(nr)
     
     # gather switch info
     c_print('Gathering device configurations')
     # run The Norn to get info
-    nr.run(task=get_info)
+    nr.run(task=get_info, cache=cache, max_age=max_age)
+    cache.save()
     # print failed hosts
     c_print(f"Failed hosts: {nr.data.failed_hosts}")
     print('~'*80)
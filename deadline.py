@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+'''
+Deadline aware maintenance window planning.
+
+Uses recorded per-model phase durations from metrics.jsonl to order and
+admit hosts so that as many stacks as possible are upgraded, reloaded and
+back up before the window ends:
+
+    - hosts are ordered shortest estimated upgrade first
+    - a host is only admitted if a slot frees up early enough for it to
+      finish before the deadline, slots follow the same worker, server,
+      site and model caps as the UpgradeScheduler that runs the hosts
+    - a reload is refused at run time if reload + recovery can no longer
+      finish before the deadline
+
+Estimates are the p90 of successful runs per model and phase, with defaults
+for models that have no history yet. Records of phases that did no work
+(skipped, resumed or waiting on a reload) are left out, they would pull the
+estimate towards zero.
+'''
+
+import os
+import time
+import heapq
+from datetime import datetime, timedelta
+from metrics import load, percentile, METRICS_FILE
+from reload_poller import BOOT_MINUTES, DEFAULT_BOOT_MINUTES
+
+
+# phases that make up one host upgrade, in order
+UPGRADE_PHASES = ['stack_upgrader', 'verify_image']
+RELOAD_PHASES = ['reload_sw', 'recovery']
+
+# seconds used when a model has no recorded history for a phase
+DEFAULT_SECONDS = {
+    'stack_upgrader': 30 * 60,
+    'verify_image': 5 * 60,
+    'reload_sw': 60,
+}
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+# "04:30" (next occurrence) or "2026-10-18T04:30" to an epoch timestamp
+def parse_window_end(value, now=None):
+    now = now or datetime.now()
+    try:
+        end = datetime.fromisoformat(value)
+    except ValueError:
+        clock = datetime.strptime(value, '%H:%M')
+        end = now.replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+        # a window ending at 04:30 started last evening
+        if end <= now:
+            end += timedelta(days=1)
+    return end.timestamp()
+
+
+# True for a record of a phase that did no work
+def noop(record):
+    if record.get('subtasks') == 0:
+        return True
+    # an install that changed nothing was skipped
+    return record['phase'] == 'stack_upgrader' and record['outcome'] != 'changed'
+
+
+class DeadlinePlanner(object):
+    def __init__(self, deadline, scheduler, history=METRICS_FILE, pct=90):
+        self.deadline = deadline
+        self.scheduler = scheduler
+        self.estimates = {}
+        if history and os.path.exists(history):
+            groups = {}
+            for r in load(history):
+                if r['outcome'] == 'failed' or noop(r):
+                    continue
+                groups.setdefault((r['model'], r['phase']), []).append(r['duration'])
+            for key, values in groups.items():
+                values.sort()
+                self.estimates[key] = percentile(values, pct)
+
+    # estimated seconds for one phase on one model
+    def estimate(self, model, phase):
+        if (model, phase) in self.estimates:
+            return self.estimates[(model, phase)]
+        if phase == 'recovery':
+            return BOOT_MINUTES.get(model, DEFAULT_BOOT_MINUTES) * 60
+        return DEFAULT_SECONDS[phase]
+
+    def seconds(self, model, phases):
+        return sum(self.estimate(model, phase) for phase in phases)
+
+    # transfer, install, reload and recovery
+    def total(self, model):
+        return self.seconds(model, UPGRADE_PHASES + RELOAD_PHASES)
+
+    # order and admit hosts, returns (admitted names, {name: reason})
+    def plan(self, hosts, now=None):
+        clock = now or time.time()
+        pending = sorted(hosts, key=lambda h: self.total(h.get('sw_model')))
+        # replay the scheduler: start every pending host that fits, then
+        # move the clock to the next finish
+        sim = self.scheduler.copy()
+        running = []
+        admitted = []
+        skipped = {}
+        while pending:
+            for host in list(pending):
+                need = self.total(host.get('sw_model'))
+                if clock + need > self.deadline:
+                    skipped[host.name] = f'needs {need / 60:.0f} min, would finish after window'
+                    pending.remove(host)
+                    continue
+                demand = sim.try_take(host)
+                if demand is None:
+                    continue
+                admitted.append(host.name)
+                pending.remove(host)
+                heapq.heappush(running, (clock + need, len(admitted), demand))
+            if pending and running:
+                clock, _, demand = heapq.heappop(running)
+                sim.release(demand)
+            elif pending:
+                # nothing running and nothing fits, caps are at least one so
+                # this is only reached if a host can never fit
+                for host in pending:
+                    skipped[host.name] = 'does not fit the scheduler caps'
+                break
+        return admitted, skipped
+
+    # True if the phases can still finish before the deadline
+    def fits(self, host, phases):
+        need = self.seconds(host.get('sw_model'), phases)
+        return time.time() + need <= self.deadline
+
+    def minutes_left(self):
+        return (self.deadline - time.time()) / 60
+
+
+# Operator free gate, same interface as ApprovalGate
+class DeadlineGate(object):
+    def __init__(self, phase, planner, phases):
+        self.phase = phase
+        self.planner = planner
+        self.phases = phases
+
+    def wait(self, host):
+        if self.planner.fits(host, self.phases):
+            return True
+        c_print(f"*** {host}: {self.phase} refused, " +
+                f"{self.planner.minutes_left():.0f} min left in window ***")
+        return False
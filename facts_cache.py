@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+'''
+On-disk device facts cache shared by stack_upgrader.py and check_version.py.
+
+Parsed facts from get_info are stored per host in a JSON file together with
+the time they were collected, the switch uptime and the running image.
+
+    - entries younger than --max-age are used without contacting the switch
+    - older entries are refreshed; show version and the boot / flash show
+      commands go in one batched round trip, so there is nothing left to
+      save by reusing cached boot / flash facts
+    - facts written by the other script are kept on refresh only while the
+      uptime has not gone down and the running image is unchanged, so a
+      switch that reloaded or changed image starts a fresh entry
+    - entries for a switch upgraded by stack_upgrader.py are dropped at the
+      install and at the reload, so a rerun inside --max-age does not see
+      the old version or install state
+'''
+
+import os
+import re
+import json
+import time
+import threading
+
+
+CACHE_FILE = '.facts_cache.json'
+# hard limit on cached facts in seconds
+CACHE_TTL = 24 * 60 * 60
+# allowed drift between projected and reported uptime, uptime is only
+# reported to the minute
+UPTIME_SLACK = 10 * 60
+
+UPTIME_UNITS = {
+    'year': 365 * 24 * 60 * 60,
+    'week': 7 * 24 * 60 * 60,
+    'day': 24 * 60 * 60,
+    'hour': 60 * 60,
+    'minute': 60,
+    'second': 1,
+}
+UPTIME_RE = re.compile(r'(\d+)\s+(year|week|day|hour|minute|second)s?')
+
+
+# convert "4 weeks, 5 days, 23 hours, 14 minutes" to seconds
+def uptime_seconds(uptime):
+    if not uptime:
+        return None
+    found = UPTIME_RE.findall(uptime)
+    if not found:
+        return None
+    return sum(int(count) * UPTIME_UNITS[unit] for count, unit in found)
+
+
+class FactsCache(object):
+    def __init__(self, path=CACHE_FILE, ttl=CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                # unreadable cache is treated as empty
+                self.entries = {}
+
+    # write the cache atomically
+    def save(self):
+        with self.lock:
+            tmp = f'{self.path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    # entry for a host if it is inside the TTL
+    def get(self, name):
+        entry = self.entries.get(name)
+        if entry and time.time() - entry['ts'] <= self.ttl:
+            return entry
+        return None
+
+    # copy cached facts into host data
+    def _apply(self, host, entry, keys):
+        for key in keys:
+            host[key] = entry['facts'][key]
+
+    # answer from cache without contacting the switch
+    def restore(self, host, keys, max_age):
+        entry = self.get(host.name)
+        if not entry or time.time() - entry['ts'] > max_age:
+            return False
+        if not all(key in entry['facts'] for key in keys):
+            return False
+        self._apply(host, entry, keys)
+        return True
+
+    # True if a fresh "show version" shows no reload and no image change
+    # since the entry was written
+    def _unchanged(self, entry, host):
+        sh_version = host['sh_version']
+        uptime = uptime_seconds(sh_version.get('uptime'))
+        if uptime is None or entry.get('uptime') is None:
+            return False
+        # uptime must have grown by the time since the entry was written
+        projected = entry['uptime'] + time.time() - entry['ts']
+        if uptime < projected - UPTIME_SLACK:
+            return False
+        if sh_version.get('running_image') != entry.get('running_image'):
+            return False
+        return host['current_version'] == entry['facts'].get('current_version')
+
+    # forget a host, its cached facts are stale once it reloads
+    def drop(self, name):
+        with self.lock:
+            self.entries.pop(name, None)
+
+    # store host facts, keeping keys written by the other script
+    def store(self, host, keys):
+        sh_version = host['sh_version']
+        with self.lock:
+            # drop facts written before a reload or image change
+            entry = self.get(host.name)
+            if entry is None or not self._unchanged(entry, host):
+                entry = {'facts': {}}
+            entry['ts'] = time.time()
+            entry['uptime'] = uptime_seconds(sh_version.get('uptime'))
+            entry['running_image'] = sh_version.get('running_image')
+            for key in keys:
+                entry['facts'][key] = host[key]
+            self.entries[host.name] = entry
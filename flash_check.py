@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+'''
+Pre-flight flash capacity check.
+
+Free and total bytes are parsed for every stack member flash from
+
+    dir all-filesystems | include Directory of|bytes total
+
+and compared to the size of upgrade_img in the local image directory, with a
+per-platform headroom factor for tar extraction / IOS-XE package expansion.
+
+Optional inventory data (defaults, group or host level):
+
+image_dir: '/images'
+'''
+
+import os
+import re
+
+
+# show command used to collect flash space for every stack member
+FLASH_CMD = "dir all-filesystems | include Directory of|bytes total"
+
+# flash needed as a multiple of the image size
+# archive download-sw /safe extracts the tar next to the running image,
+# IOS-XE install mode keeps the .bin and the expanded packages
+HEADROOM = {
+    '3750': 1.1,
+    '3650': 2.2,
+    '3850': 2.2,
+    '9300': 2.2,
+}
+DEFAULT_HEADROOM = 2.2
+# fixed reserve on top of the headroom for logs and crashinfo
+RESERVE = 10 * 1024 * 1024
+
+DIR_RE = re.compile(r'Directory of (\S+?):?/')
+BYTES_RE = re.compile(r'(\d+) bytes total \((\d+) bytes free\)')
+MEMBER_RE = re.compile(r'^flash(-?\d+)?$')
+
+
+# parse flash space per filesystem, {'flash1': {'total': .., 'free': ..}}
+def parse_flash(output):
+    flash = {}
+    # plain "show flash: | incl bytes" output has no directory header
+    fs = 'flash'
+    for line in output.splitlines():
+        m = DIR_RE.search(line)
+        if m:
+            fs = m.group(1)
+            continue
+        m = BYTES_RE.search(line)
+        if m and MEMBER_RE.match(fs):
+            flash[fs] = {'total': int(m.group(1)), 'free': int(m.group(2))}
+    # "flash" is an alias of the active member when members are listed
+    if len(flash) > 1:
+        flash.pop('flash', None)
+    return flash
+
+
+# local image directory
+def image_dir(host):
+    return host.get('image_dir') or 'images'
+
+
+# size of the upgrade image on the image server, None if not found locally
+def image_size(host, upgrade_img):
+    path = os.path.join(image_dir(host), upgrade_img)
+    if not os.path.isfile(path):
+        return None
+    return os.path.getsize(path)
+
+
+# bytes of flash needed on each member for a model and image size
+def space_needed(sw_model, size):
+    factor = DEFAULT_HEADROOM
+    for platform, headroom in HEADROOM.items():
+        if platform in sw_model:
+            factor = headroom
+            break
+    return int(size * factor) + RESERVE
+
+
+# members without enough free flash, {member: bytes missing}
+# returns None when the image size or flash space is unknown
+def flash_shortfall(flash, sw_model, size):
+    if not flash or size is None:
+        return None
+    needed = space_needed(sw_model, size)
+    return {
+        fs: needed - space['free']
+        for fs, space in flash.items()
+        if space['free'] < needed
+    }
+
+
+# human readable megabytes
+def mb(num):
+    return f"{num / 1024 / 1024:.0f} MB"
@@ -1,32 +1,136 @@
+#!/usr/bin/python3
+'''
+This script loads an FTP server for /images
+
+Usage:
+
+    python3 ftp_server.py [--config ftp_server.yaml] [--production]
+
+Optional config file keys (defaults shown):
+
+port: 8000
+root: '/images'
+max_cons: 256
+max_cons_per_ip: 5
+workers: 0            # worker processes in production mode, 0 = CPU count
+use_sendfile: true
+transfer_log: 'ftp_transfers.log'
+
+--production binds the listening socket, then forks worker processes that
+each build their own async server and IO loop on it, with sendfile
+transfers. The kernel does not hand the workers equal shares of the
+connections, so every worker gets the full limits: max_cons and
+max_cons_per_ip count FTP sessions per worker. A session holds a control
+socket, and during a transfer a passive listener and a data socket, so the
+per worker socket limit is sized for all three.
+'''
+
 import os
+import socket
+import logging
+import argparse
+import yaml
 
 from pyftpdlib.authorizers import DummyAuthorizer
 from pyftpdlib.handlers import FTPHandler
 from pyftpdlib.servers import FTPServer
+from pyftpdlib.ioloop import IOLoop
+from pyftpdlib.prefork import fork_processes
 
-def main():
+
+# Server defaults used when the config file has no value
+DEFAULTS = {
+    'port': 8000,
+    'root': '/images',
+    'max_cons': 256,
+    'max_cons_per_ip': 5,
+    'workers': 0,
+    'use_sendfile': True,
+    'transfer_log': 'ftp_transfers.log',
+}
+
+# control, passive listener and data socket of a session in a transfer
+SOCKETS_PER_SESSION = 3
+
+transfer_log = logging.getLogger('ftp_transfers')
+
+
+# FTP handler that logs bytes, duration and throughput for every transfer
+class ImageFTPHandler(FTPHandler):
+    def log_transfer(self, cmd, filename, receive, completed, elapsed, bytes):
+        super().log_transfer(cmd, filename, receive, completed, elapsed, bytes)
+        rate = bytes / elapsed / 1024 / 1024 if elapsed else 0
+        transfer_log.info(
+            f"{self.remote_ip} {cmd} {os.path.basename(filename)} "
+            f"bytes={bytes} seconds={elapsed:.3f} MBps={rate:.2f} "
+            f"completed={completed} pid={os.getpid()}"
+        )
+
+
+# load config file over defaults
+def load_config(path=None):
+    config = dict(DEFAULTS)
+    if path:
+        with open(path) as f:
+            config.update(yaml.safe_load(f) or {})
+    return config
+
+
+# build the FTP server from config, every worker gets the full limits,
+# sock is a listening socket shared by forked workers
+def build_server(config, sock=None):
     # Instantiate a dummy authorizer for managing 'virtual' users
     authorizer = DummyAuthorizer()
 
-    # Define a new user having full r/w permissions and a read-only
-    # anonymous user
-    authorizer.add_anonymous('/images')
+    # read-only anonymous user for the image directory
+    authorizer.add_anonymous(config['root'])
 
     # Instantiate FTP handler class
-    handler = FTPHandler
+    handler = ImageFTPHandler
     handler.authorizer = authorizer
+    handler.use_sendfile = config['use_sendfile']
+
+    # Instantiate FTP server class and listen on 0.0.0.0:port, with its own
+    # IO loop so forked workers do not share one epoll object
+    server = FTPServer(sock or ('', config['port']), handler,
+                       ioloop=IOLoop(), backlog=config['max_cons'])
+
+    # set a limit for connections, pyftpdlib counts every socket of the
+    # worker including the listening socket
+    server.max_cons = config['max_cons'] * SOCKETS_PER_SESSION + 1
+    server.max_cons_per_ip = config['max_cons_per_ip']
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FTP server for switch images')
+    parser.add_argument('--config', default=None, help='YAML config file')
+    parser.add_argument('--production', action='store_true',
+        help='serve with multiple worker processes')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
 
-    # Instantiate FTP server class and listen on 0.0.0.0:8000
-    address = ('', 8000)
-    server = FTPServer(address, handler)
+    # per transfer log
+    logging.basicConfig(level=logging.INFO)
+    log_file = logging.FileHandler(config['transfer_log'])
+    log_file.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    transfer_log.addHandler(log_file)
 
-    # set a limit for connections
-    server.max_cons = 256
-    server.max_cons_per_ip = 5
+    workers = 1
+    if args.production:
+        workers = config['workers'] or os.cpu_count() or 1
 
-    # start ftp server
+    # start ftp server, workers fork after the bind and build their own
+    # server on the shared socket
+    sock = None
+    if workers > 1:
+        sock = socket.create_server(('', config['port']), backlog=config['max_cons'])
+        fork_processes(workers)
+    server = build_server(config, sock)
     server.serve_forever()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
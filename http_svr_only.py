@@ -3,27 +3,9 @@
 This script loads an HTTP server for /images
 '''
 
-import threading
-import socketserver
-import os, sys, time, socket
+import os
 from nornir import InitNornir
-from http.server import SimpleHTTPRequestHandler
-
-
-# HTTP server for file transfer
-class ThreadedHTTPServer(object):
-    handler = SimpleHTTPRequestHandler
-    def __init__(self, host, port):
-        self.server = socketserver.TCPServer((host, port), self.handler)
-        self.server_thread = threading.Thread(target=self.server.serve_forever)
-        self.server_thread.daemon = True
-
-    def start(self):
-        self.server_thread.start()
-
-    def stop(self):
-        self.server.shutdown()
-        self.server.server_close()
+from image_server import ThreadedHTTPServer
 
 
 # Print formatting function
@@ -48,7 +30,8 @@ def main():
 
     c_print(f"http://{http_svr}:8000")
     # init http server
-    server = ThreadedHTTPServer(http_svr, 8000)
+    max_clients = nr.inventory.defaults.data.get('http_max_clients', 64)
+    server = ThreadedHTTPServer(http_svr, 8000, "/images", max_clients)
     # start http server
     server.start()
     print('~'*80)
@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+'''
+Image catalog for the image directory.
+
+Scans the image directory once, hashes each image (MD5 and SHA512 in one
+mmap pass), parses platform and version from the file name and stores it all
+in a sidecar index. Files are only hashed again when their size or mtime
+changes.
+
+    cat9k_iosxe.16.09.04.SPA.bin            -> cat9k_iosxe  16.9.4
+    c3750e-universalk9-tar.152-4.E8.tar     -> c3750e       15.2(4)E8
+
+Usage:
+
+    python3 image_catalog.py [/images]
+'''
+
+import os
+import re
+import sys
+import json
+import mmap
+import hashlib
+import threading
+
+
+INDEX_FILE = '.image_catalog.json'
+# bytes hashed per slice of the mapped file
+CHUNK = 16 * 1024 * 1024
+
+# IOS-XE bundles, cat3k_caa-universalk9.16.09.04.SPA.bin
+XE_RE = re.compile(
+    r'^(?P<platform>[a-z0-9_]+?)(?:-(?P<feature>\w+))?\.'
+    r'(?P<version>\d+\.\d+\.\d+[a-z]?)\.SPA\.bin$')
+# classic IOS tar / bin, c3750-ipservicesk9-tar.122-55.SE12.tar
+IOS_RE = re.compile(
+    r'^(?P<platform>c\d+\w*?)-(?P<feature>\w+?)-(?:tar|mz)\.'
+    r'(?P<major>\d\d)(?P<minor>\d+)-(?P<release>\d+)\.(?P<train>[A-Z]+)(?P<rebuild>\d*)'
+    r'\.(?:tar|bin)$')
+# "verify /md5 (flash:img) = 0fe67d6a10fc551a4603824add947a95"
+VERIFY_RE = re.compile(r'=\s*([0-9a-f]{32})\b')
+
+
+# platform, feature set and version from an image file name
+def parse_image_name(name):
+    m = XE_RE.match(name)
+    if m:
+        # 16.09.04 is shown as 16.9.4 on the switch
+        version = '.'.join(str(int(p)) if p.isdigit() else p
+                           for p in m.group('version').split('.'))
+        return {
+            'platform': m.group('platform'),
+            'feature': m.group('feature'),
+            'version': version,
+        }
+    m = IOS_RE.match(name)
+    if m:
+        version = f"{m.group('major')}.{m.group('minor')}({m.group('release')})" + \
+            f"{m.group('train')}{m.group('rebuild')}"
+        return {
+            'platform': m.group('platform'),
+            'feature': m.group('feature'),
+            'version': version,
+        }
+    return {'platform': None, 'feature': None, 'version': None}
+
+
+# md5 from "verify /md5" output, None if the command failed
+def verify_md5(output):
+    m = VERIFY_RE.search(output)
+    return m.group(1) if m else None
+
+
+# MD5 and SHA512 of a file in one pass over a read-only mapping
+def hash_file(path):
+    md5 = hashlib.md5()
+    sha512 = hashlib.sha512()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, size, CHUNK):
+                        with view[offset:offset + CHUNK] as piece:
+                            md5.update(piece)
+                            sha512.update(piece)
+                finally:
+                    view.release()
+    return md5.hexdigest(), sha512.hexdigest()
+
+
+class ImageCatalog(object):
+    def __init__(self, directory='images'):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILE)
+        self.lock = threading.Lock()
+        self.images = {}
+        self.scan()
+
+    # load the index and hash only new or changed images
+    def scan(self):
+        index = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    index = json.load(f)
+            except ValueError:
+                index = {}
+
+        images = {}
+        changed = False
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                cached = index.get(entry.name)
+                if cached and cached['size'] == stat.st_size and \
+                        cached['mtime'] == stat.st_mtime:
+                    images[entry.name] = cached
+                    continue
+                md5, sha512 = hash_file(entry.path)
+                image = parse_image_name(entry.name)
+                image.update({
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'md5': md5,
+                    'sha512': sha512,
+                })
+                images[entry.name] = image
+                changed = True
+
+        self.images = images
+        if changed or set(images) != set(index):
+            self.save()
+
+    # write the index atomically next to the images
+    def save(self):
+        with self.lock:
+            tmp = f'{self.path}.tmp'
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump(self.images, f, indent=2, sort_keys=True)
+                os.replace(tmp, self.path)
+            except OSError:
+                # read-only image directory, keep the index in memory
+                pass
+
+    def get(self, name):
+        return self.images.get(name)
+
+    def md5(self, name):
+        image = self.images.get(name)
+        return image['md5'] if image else None
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else 'images'
+    catalog = ImageCatalog(directory)
+    for name, image in sorted(catalog.images.items()):
+        print(f"{name}")
+        print(f"{' ' *4}{image['platform']} {image['version']} {image['size']} bytes")
+        print(f"{' ' *4}md5    {image['md5']}")
+        print(f"{' ' *4}sha512 {image['sha512'][:64]}...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+'''
+Concurrent HTTP image server for switch downloads.
+
+    - one thread per request (ThreadingHTTPServer)
+    - file bodies sent with os.sendfile, no copy through Python buffers
+    - HTTP Range requests so interrupted downloads can resume
+    - a concurrency limit, extra clients wait in a queue for a free slot,
+      IOS copy and archive download-sw do not retry a 503, so one is only
+      sent after queue_timeout seconds of waiting
+'''
+
+import os
+import re
+import threading
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+# bytes per sendfile call
+CHUNK = 8 * 1024 * 1024
+# seconds a download waits for a free slot before it gets a 503
+QUEUE_TIMEOUT = 30 * 60
+
+
+class ImageRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # directory listings and HEAD still use SimpleHTTPRequestHandler
+    def do_GET(self):
+        slots = self.server.slots
+        # queue behind the running downloads
+        if not slots.acquire(timeout=self.server.queue_timeout):
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, 'Too many downloads')
+            return
+        try:
+            self.send_image()
+        finally:
+            # free the slot as soon as the body is out
+            slots.release()
+
+    # parse a single "Range: bytes=start-end" header, returns (start, end)
+    def parse_range(self, size):
+        header = self.headers.get('Range')
+        if not header:
+            return None
+        m = RANGE_RE.match(header.strip())
+        if not m or (not m.group(1) and not m.group(2)):
+            return None
+        if m.group(1):
+            start = int(m.group(1))
+            end = int(m.group(2)) if m.group(2) else size - 1
+        else:
+            # suffix range, last N bytes
+            start = max(0, size - int(m.group(2)))
+            end = size - 1
+        return start, min(end, size - 1)
+
+    def send_image(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            # fall back to the stock handler for directory listings
+            f = self.send_head()
+            if f:
+                try:
+                    self.copyfile(f, self.wfile)
+                finally:
+                    f.close()
+            return
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            byte_range = self.parse_range(size)
+            if byte_range:
+                start, end = byte_range
+                if start >= size or start > end:
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                start, end = 0, size - 1
+                self.send_response(HTTPStatus.OK)
+
+            length = end - start + 1
+            self.send_header('Content-Type', self.guess_type(path))
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+            self.wfile.flush()
+            self.sendfile(f, start, length)
+
+    # zero copy body transfer, falls back to a buffered copy without sendfile
+    def sendfile(self, f, offset, length):
+        if hasattr(os, 'sendfile'):
+            out = self.connection.fileno()
+            try:
+                while length > 0:
+                    sent = os.sendfile(out, f.fileno(), offset, min(CHUNK, length))
+                    if sent == 0:
+                        return
+                    offset += sent
+                    length -= sent
+                return
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except OSError:
+                # socket type without sendfile support, finish buffered
+                pass
+        f.seek(offset)
+        while length > 0:
+            buf = f.read(min(CHUNK, length))
+            if not buf:
+                return
+            self.wfile.write(buf)
+            length -= len(buf)
+
+    # keep per-request logging quiet, 300 switches make a lot of noise
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ImageHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, directory='/images', max_clients=64, verbose=False,
+                 queue_timeout=QUEUE_TIMEOUT):
+        self.slots = threading.BoundedSemaphore(max_clients)
+        self.queue_timeout = queue_timeout
+        self.verbose = verbose
+
+        def handler(*args, **kwargs):
+            return ImageRequestHandler(*args, directory=directory, **kwargs)
+
+        super().__init__(address, handler)
+
+
+# HTTP server for file transfer
+class ThreadedHTTPServer(object):
+    def __init__(self, host, port, directory='/images', max_clients=64):
+        self.server = ImageHTTPServer((host, port), directory, max_clients)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+
+    def start(self):
+        self.server_thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
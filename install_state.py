@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+'''
+Pending install detection for IOS-XE stacks.
+
+An IOS-XE stack that already had the target release installed, but was not
+reloaded yet, needs only the reload. The install state is read in the same
+batch as show version by get_info, and cached with the other facts:
+
+    show boot                 BOOT variable = flash:packages.conf;
+    show install summary      IMG   U    16.9.4.0.2222
+    more flash:packages.conf  # pkginfo: Release: 16.9.4
+                              boot  rp 0 0  rp_boot  cat3k_caa-rpbase.16.09.04.SPA.pkg
+
+IOS stacks answer the last two with an error, which is ignored. The pending
+version is an image activated but uncommitted (install mode) or the release
+packages.conf boots when it differs from the running one (request platform
+software package install).
+'''
+
+import re
+from show_parser import parse_show_boot
+from versions import same_version
+
+
+# models that install through packages.conf
+XE_MODELS = ('3650', '3850', '9300')
+
+PACKAGES_CMD = "more flash:packages.conf | include pkginfo: Release|rp_boot"
+INSTALL_CMDS = ["show boot", "show install summary", PACKAGES_CMD]
+
+# "IMG   U    16.9.4.0.2222"
+SUMMARY_RE = re.compile(r'^IMG\s+([ICUD])\s+(\d+\.\d+\.\d+[a-z]?)', re.M)
+# "# pkginfo: Release: 16.9.4"
+RELEASE_RE = re.compile(r'pkginfo: Release:\s*(\S+)')
+# "cat3k_caa-rpbase.16.09.04.SPA.pkg"
+PKG_RE = re.compile(r'\.(\d+\.\d+\.\d+[a-z]?)\.SPA\.pkg')
+
+
+def is_xe(sw_model):
+    return any(model in sw_model for model in XE_MODELS)
+
+
+# [(state, version)] from show install summary
+def parse_install_summary(output):
+    return SUMMARY_RE.findall(output or '')
+
+
+# release packages.conf boots, None if it is not readable
+def parse_packages_conf(output):
+    m = RELEASE_RE.search(output or '') or PKG_RE.search(output or '')
+    return m.group(1) if m else None
+
+
+# version waiting for the next reload, None if nothing is pending
+def pending_version(outputs, current):
+    # install mode, activated and not committed yet
+    for state, version in parse_install_summary(outputs.get("show install summary")):
+        if state == 'U':
+            return version
+    # bundle / package mode, packages.conf already points at another release
+    boot = parse_show_boot(outputs.get("show boot") or '')
+    if boot and boot[0]['boot_path'].endswith('packages.conf'):
+        release = parse_packages_conf(outputs.get(PACKAGES_CMD))
+        if release and not same_version(release, current):
+            return release
+    return None
+
+
+# version pending a reload from the get_info batch, None for IOS stacks
+def batch_pending(sw_model, outputs, current):
+    if not is_xe(sw_model):
+        return None
+    return pending_version(outputs, current)
+
+
+# flag a stack whose desired version only needs a reload
+def flag_pending(host, desired):
+    pending = host.get('pending_version')
+    host['pending_reload'] = pending is not None and same_version(pending, desired)
+    return host['pending_reload']
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+'''
+Compiled inventory cache for fast startup on large inventories.
+
+CachedInventory is a Nornir inventory plugin that builds the inventory with
+SimpleInventory once and stores a pickle snapshot of the hosts, groups and
+defaults. Later runs load the snapshot instead of parsing YAML and building
+objects. The snapshot is keyed by the source files: a size / mtime change
+triggers a content hash check, and only changed content causes a rebuild.
+
+The snapshot also holds an index of host names by platform, site and group,
+so filter_index() can select hosts without a linear scan.
+'''
+
+import os
+import json
+import pickle
+import hashlib
+from nornir.core import Nornir
+from nornir.core.inventory import Inventory
+from nornir.plugins.inventory.simple import SimpleInventory
+
+
+CACHE_DIR = '.inventory_cache'
+# bump when the snapshot layout changes
+SNAPSHOT_VERSION = 1
+# host attributes kept in the filter index
+INDEX_KEYS = ('platform', 'site', 'groups')
+
+
+# stat and hash of each source file
+def _stat(path):
+    stat = os.stat(path)
+    return {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def _digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# host names by platform, site and group
+def build_index(hosts):
+    index = {}
+    for name, host in hosts.items():
+        keys = [('platform', host.platform), ('site', host.get('site'))]
+        keys += [('groups', group) for group in host.groups]
+        for key in keys:
+            index.setdefault(f'{key[0]}={key[1]}', []).append(name)
+    return index
+
+
+class CachedInventory(Inventory):
+    def __init__(self, host_file='hosts.yaml', group_file='groups.yaml',
+                 defaults_file='defaults.yaml', cache_dir=CACHE_DIR, *args, **kwargs):
+        sources = [p for p in (host_file, group_file, defaults_file) if os.path.exists(p)]
+        name = hashlib.sha1('|'.join(os.path.abspath(p) for p in sources).encode()).hexdigest()
+        self.cache_path = os.path.join(cache_dir, f'{name}.pickle')
+        self.manifest_path = os.path.join(cache_dir, f'{name}.json')
+
+        snapshot = self._load(sources)
+        if snapshot is None:
+            simple = SimpleInventory.deserialize(
+                host_file=host_file, group_file=group_file, defaults_file=defaults_file)
+            snapshot = {
+                'hosts': simple.hosts,
+                'groups': simple.groups,
+                'defaults': simple.defaults,
+                'index': build_index(simple.hosts),
+            }
+            self._save(sources, snapshot)
+
+        self.index = snapshot['index']
+        super().__init__(
+            hosts=snapshot['hosts'],
+            groups=snapshot['groups'],
+            defaults=snapshot['defaults'],
+            *args,
+            **kwargs
+        )
+
+    # entry point InitNornir calls for inventory plugins
+    @classmethod
+    def deserialize(cls, transform_function=None, transform_function_options=None,
+                    config=None, **options):
+        return cls(
+            transform_function=transform_function,
+            transform_function_options=transform_function_options or {},
+            **options
+        )
+
+    # snapshot if the sources are unchanged, None if it must be rebuilt
+    def _load(self, sources):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != SNAPSHOT_VERSION or \
+                [m['path'] for m in manifest['sources']] != sources:
+            return None
+
+        touched = False
+        for entry in manifest['sources']:
+            stat = _stat(entry['path'])
+            if stat['size'] == entry['size'] and stat['mtime'] == entry['mtime']:
+                continue
+            # size or mtime changed, only the content hash decides
+            if stat['size'] != entry['size'] or _digest(entry['path']) != entry['sha1']:
+                return None
+            entry.update(stat)
+            touched = True
+
+        try:
+            with open(self.cache_path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, AttributeError):
+            return None
+        if touched:
+            self._write_manifest(manifest)
+        return snapshot
+
+    def _write_manifest(self, manifest):
+        tmp = f'{self.manifest_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def _save(self, sources, snapshot):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp = f'{self.cache_path}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.cache_path)
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'sources': [dict(_stat(p), sha1=_digest(p)) for p in sources],
+        }
+        self._write_manifest(manifest)
+
+
+# filter on indexed attributes, e.g. filter_index(nr, platform="ios"),
+# falls back to Nornir.filter for inventories without an index
+def filter_index(nr, **kwargs):
+    index = getattr(nr.inventory, 'index', None)
+    if index is None or any(key not in INDEX_KEYS for key in kwargs):
+        return nr.filter(**kwargs)
+
+    # walk the first index list, it is already in inventory order
+    lists = [index.get(f'{key}={value}', []) for key, value in kwargs.items()]
+    names = lists[0] if lists else list(nr.inventory.hosts)
+    for other in lists[1:]:
+        other = set(other)
+        names = [name for name in names if name in other]
+    hosts = nr.inventory.hosts
+
+    filtered = Nornir(**nr.__dict__)
+    filtered.inventory = Inventory(
+        hosts={name: hosts[name] for name in names if name in hosts},
+        groups=nr.inventory.groups,
+        defaults=nr.inventory.defaults,
+    )
+    return filtered
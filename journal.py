@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+'''
+Append-only per-host phase journal for crash-safe resume.
+
+PhaseJournal is a Nornir processor that appends one JSON line each time a
+host completes an upgrade phase, with the host facts later phases need:
+
+    {"ts": .., "host": "sw1", "phase": "stack_upgrader",
+     "facts": {"sw_model": "C3750X", "current_version": "15.2(4)E7", "upgrade": true}}
+
+Every line is flushed and synced before the next phase starts, so a crash
+or an "n" at a prompt loses nothing that already finished. Each run starts
+with a start line; a --resume run restores the phases and facts recorded
+since the last fresh start and the tasks skip the phases already done.
+'''
+
+import os
+import json
+import time
+import threading
+
+
+JOURNAL_FILE = 'upgrade_journal.jsonl'
+
+# phases recorded in the journal
+PHASES = ('get_info', 'check_ver', 'stage_image', 'stack_upgrader',
+          'verify_image', 'reload_sw')
+# host facts restored on resume
+FACTS = ('sw_model', 'current_version', 'upgrade', 'flash', 'staged',
+         'pending_reload', 'md5_verified', 'reload_time')
+
+
+# True if a resumed host already completed the phase
+def done(host, phase):
+    return phase in (host.get('done_phases') or ())
+
+
+class PhaseJournal(object):
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _append(self, line, prefix=''):
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(prefix + json.dumps(line) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    # mark the start of a run, a fresh start hides earlier records on resume
+    def start(self, resume=False):
+        # end a line torn by a crash so the start line stays readable
+        prefix = ''
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    prefix = '\n'
+        self._append({'ts': time.time(), 'event': 'start', 'resume': resume}, prefix)
+
+    def record(self, host, phase):
+        facts = {key: host.get(key) for key in FACTS if host.get(key) is not None}
+        self._append({'ts': time.time(), 'host': str(host), 'phase': phase, 'facts': facts})
+
+    # {host: {'phases': [..], 'facts': {..}}} since the last fresh start
+    def load(self):
+        hosts = {}
+        if not os.path.exists(self.path):
+            return hosts
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn last line from a crash mid write
+                    continue
+                if entry.get('event') == 'start':
+                    if not entry.get('resume'):
+                        hosts = {}
+                    continue
+                state = hosts.setdefault(entry['host'], {'phases': [], 'facts': {}})
+                if entry['phase'] not in state['phases']:
+                    state['phases'].append(entry['phase'])
+                state['facts'].update(entry['facts'])
+        return hosts
+
+    # load completed phases and facts into host data, returns hosts restored
+    def restore(self, nr):
+        restored = 0
+        for name, state in self.load().items():
+            if name not in nr.inventory.hosts:
+                continue
+            host = nr.inventory.hosts[name]
+            for key, value in state['facts'].items():
+                host[key] = value
+            host['done_phases'] = state['phases']
+            restored += 1
+        return restored
+
+    def _completed(self, task, host, result):
+        if task.name in PHASES and not result.failed:
+            self.record(host, task.name)
+
+    # Nornir processor interface
+    def task_started(self, task):
+        pass
+
+    def task_completed(self, task, result):
+        pass
+
+    def task_instance_started(self, task, host):
+        pass
+
+    def task_instance_completed(self, task, host, result):
+        self._completed(task, host, result)
+
+    def subtask_instance_started(self, task, host):
+        pass
+
+    def subtask_instance_completed(self, task, host, result):
+        self._completed(task, host, result)
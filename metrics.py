@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+'''
+Per-host, per-phase timing for Nornir runs.
+
+PhaseTimer is a Nornir processor that times every task and subtask instance
+(get_info, check_ver, stack_upgrader, reload_sw and each
+netmiko_send_command inside them) with a monotonic clock. Each record is
+written as one JSON line:
+
+    {"ts": .., "host": "sw1", "model": "C3750X", "phase": "stack_upgrader",
+     "parent": null, "duration": 412.3, "outcome": "changed", "subtasks": 3}
+
+subtasks counts the direct subtasks a task ran; a phase skipped because it
+was already done, not needed or waiting on a reload runs none.
+
+Usage:
+
+    python3 metrics.py summary [metrics.jsonl]
+'''
+
+import sys
+import json
+import time
+import threading
+
+
+METRICS_FILE = 'metrics.jsonl'
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+class PhaseTimer(object):
+    def __init__(self, path=METRICS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.started = {}
+        # per thread stack of running [task name, subtask count], gives
+        # subtasks their parent
+        self.local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    # write one record to the JSON lines file
+    def record(self, host, phase, duration, outcome, model=None, **extra):
+        line = {
+            'ts': time.time(),
+            'host': str(host),
+            'model': model,
+            'phase': phase,
+            'duration': round(duration, 3),
+            'outcome': outcome,
+        }
+        line.update(extra)
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(line) + '\n')
+
+    def _start(self, task, host):
+        stack = self._stack()
+        parent = None
+        if stack:
+            parent = stack[-1][0]
+            stack[-1][1] += 1
+        stack.append([task.name, 0])
+        self.started[id(task)] = (time.monotonic(), parent)
+
+    def _finish(self, task, host, result):
+        started, parent = self.started.pop(id(task), (time.monotonic(), None))
+        stack = self._stack()
+        subtasks = stack.pop()[1] if stack else 0
+        if result.failed:
+            outcome = 'failed'
+        elif result.changed:
+            outcome = 'changed'
+        else:
+            outcome = 'ok'
+        extra = {}
+        command = task.params.get('command_string')
+        if command is not None:
+            extra['command'] = command
+        self.record(
+            host,
+            task.name,
+            time.monotonic() - started,
+            outcome,
+            model=host.get('sw_model'),
+            parent=parent,
+            subtasks=subtasks,
+            **extra
+        )
+
+    # Nornir processor interface
+    def task_started(self, task):
+        pass
+
+    def task_completed(self, task, result):
+        pass
+
+    def task_instance_started(self, task, host):
+        self._start(task, host)
+
+    def task_instance_completed(self, task, host, result):
+        self._finish(task, host, result)
+
+    def subtask_instance_started(self, task, host):
+        self._start(task, host)
+
+    def subtask_instance_completed(self, task, host, result):
+        self._finish(task, host, result)
+
+
+# load records from a JSON lines file
+def load(path=METRICS_FILE):
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+# nearest rank percentile of a sorted list
+def percentile(values, pct):
+    if not values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(values))))
+    return values[min(rank, len(values)) - 1]
+
+
+# group durations by key function, {key: sorted durations}
+def durations(records, key):
+    groups = {}
+    for r in records:
+        groups.setdefault(key(r), []).append(r['duration'])
+    for values in groups.values():
+        values.sort()
+    return groups
+
+
+def print_table(title, groups):
+    c_print(title)
+    print(f"{'':<40}{'count':>7}{'p50':>10}{'p95':>10}{'max':>10}")
+    for key, values in sorted(groups.items(), key=lambda kv: str(kv[0])):
+        label = key if isinstance(key, str) else ' / '.join(str(k) for k in key)
+        print(f"{label[:39]:<40}{len(values):>7}{percentile(values, 50):>10.1f}" +
+              f"{percentile(values, 95):>10.1f}{values[-1]:>10.1f}")
+
+
+# print p50 / p95 / max per phase and per phase and model
+def summary(path=METRICS_FILE):
+    records = load(path)
+    print_table('*** seconds per phase ***', durations(records, lambda r: r['phase']))
+    print_table('*** seconds per phase and model ***',
+                durations(records, lambda r: (r['phase'], r['model'])))
+    failed = [r for r in records if r['outcome'] == 'failed']
+    c_print(f'{len(records)} records, {len(failed)} failed')
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'summary':
+        print(f'usage: {sys.argv[0]} summary [{METRICS_FILE}]')
+        sys.exit(1)
+    summary(sys.argv[2] if len(sys.argv) > 2 else METRICS_FILE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+'''
+Image mirror selection by measured RTT and throughput.
+
+Each host may list the mirrors it can pull images from, at defaults, group
+(site) or host level:
+
+mirrors:
+    - ip: 10.10.10.101
+      cons: 8           # connection cap, default 8
+    - ip: 10.20.0.5
+      port: 8080        # http only, default http_port or 8000, ftp and
+      cons: 4           # tftp are always pulled from 21 and 69
+
+Every distinct mirror is probed once, concurrently, from the orchestrator
+over the transport the host will pull with: TCP connect RTT plus a short
+FTP or HTTP Range sample of an image, or for TFTP the first reply and a
+short lock-step sample. Each host is then assigned the mirror with the
+lowest expected transfer time, where a mirror that already has cons hosts
+assigned counts as another full transfer per extra round. The result is
+stored in host data as image_server / image_server_port /
+image_server_cons, which the transfer URL and the scheduler connection cap
+use. Hosts pushed over scp
+do not use a mirror.
+
+select_mirrors() assigns every host to upgrade at once, a MirrorSelector
+shared by pipelined hosts assigns each host when it is ready to transfer.
+'''
+
+import math
+import time
+import socket
+import struct
+import ftplib
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from flash_check import image_size
+from plan import model_data
+from transports import PULL, HTTP_PORT, transport_for
+
+
+MIRROR_DEFAULTS = {'cons': 8}
+# switches pull ftp and tftp from the standard ports, only http URLs carry one
+PROBE_PORTS = {'ftp': 21, 'tftp': 69}
+# bytes read for the throughput sample
+SAMPLE_BYTES = 4 * 1024 * 1024
+# TFTP moves one 512 byte block per round trip, a short sample is enough
+TFTP_SAMPLE_BYTES = 64 * 1024
+TFTP_BLOCK = 512
+# round trips charged for session setup and per transfer overhead
+SETUP_RTTS = 20
+# image size assumed when the image is not in the local image directory
+DEFAULT_SIZE = 500 * 1024 * 1024
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+class SampleDone(Exception):
+    pass
+
+
+# mirrors listed for a host with defaults filled in for its transport
+def host_mirrors(host):
+    transport = transport_for(host)
+    if transport not in PULL:
+        return []
+    mirrors = []
+    for m in host.get('mirrors') or []:
+        mirror = dict(MIRROR_DEFAULTS)
+        mirror.update(m)
+        mirror['transport'] = transport
+        if transport == 'http':
+            mirror['port'] = m.get('port') or host.get('http_port') or HTTP_PORT
+        else:
+            mirror['port'] = PROBE_PORTS[transport]
+        mirrors.append(mirror)
+    return mirrors
+
+
+# probe cache key, one probe per server, transport and port
+def probe_key(mirror):
+    return (mirror['ip'], mirror['transport'], mirror['port'])
+
+
+# lowest TCP connect time in seconds, None if unreachable
+def tcp_rtt(ip, port, tries=3, timeout=3):
+    best = None
+    for _ in range(tries):
+        started = time.monotonic()
+        try:
+            sock = socket.create_connection((ip, port), timeout=timeout)
+        except OSError:
+            continue
+        rtt = time.monotonic() - started
+        sock.close()
+        best = rtt if best is None else min(best, rtt)
+    return best
+
+
+# bytes per second for the first SAMPLE_BYTES of an image, None on error
+def sample_rate(ip, port, image, nbytes=SAMPLE_BYTES, timeout=10):
+    received = [0]
+
+    def _chunk(data):
+        received[0] += len(data)
+        if received[0] >= nbytes:
+            raise SampleDone()
+
+    try:
+        ftp = ftplib.FTP()
+        ftp.connect(ip, port, timeout=timeout)
+        ftp.login()
+        started = time.monotonic()
+        try:
+            ftp.retrbinary(f'RETR {image}', _chunk)
+        except SampleDone:
+            pass
+        seconds = time.monotonic() - started
+        ftp.close()
+    except (OSError, ftplib.Error):
+        return None
+    return received[0] / seconds if received[0] and seconds else None
+
+
+# bytes per second for a Range request of the first SAMPLE_BYTES, None on error
+def http_rate(ip, port, image, nbytes=SAMPLE_BYTES, timeout=10):
+    try:
+        conn = http.client.HTTPConnection(ip, port, timeout=timeout)
+        started = time.monotonic()
+        conn.request('GET', f'/{image}', headers={'Range': f'bytes=0-{nbytes - 1}'})
+        resp = conn.getresponse()
+        if resp.status not in (200, 206):
+            conn.close()
+            return None
+        received = 0
+        while received < nbytes:
+            data = resp.read(min(64 * 1024, nbytes - received))
+            if not data:
+                break
+            received += len(data)
+        seconds = time.monotonic() - started
+        conn.close()
+    except (OSError, http.client.HTTPException):
+        return None
+    return received / seconds if received and seconds else None
+
+
+# (first reply seconds, bytes per second) for a lock-step TFTP read,
+# (None, None) on error
+def tftp_sample(ip, port, image, nbytes=TFTP_SAMPLE_BYTES, timeout=3):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    try:
+        started = time.monotonic()
+        sock.sendto(b'\x00\x01' + image.encode() + b'\x00octet\x00', (ip, port))
+        rtt = None
+        received = 0
+        block = 1
+        while received < nbytes:
+            data, server = sock.recvfrom(4 + TFTP_BLOCK)
+            opcode, number = struct.unpack('!HH', data[:4])
+            if opcode != 3:
+                return None, None
+            if rtt is None:
+                rtt = time.monotonic() - started
+            if number == block:
+                received += len(data) - 4
+                block = (block + 1) % 65536
+            sock.sendto(struct.pack('!HH', 4, number), server)
+            if len(data) - 4 < TFTP_BLOCK:
+                break
+        seconds = time.monotonic() - started
+        # stop the server sending the rest of the image
+        sock.sendto(struct.pack('!HH', 5, 0) + b'sample done\x00', server)
+    except (OSError, struct.error):
+        return None, None
+    finally:
+        sock.close()
+    return rtt, (received / seconds if received and seconds else None)
+
+
+def probe_mirror(mirror, image):
+    ip, transport, port = probe_key(mirror)
+    probe = {'ip': ip, 'transport': transport, 'rtt': None, 'rate': None}
+    if transport == 'tftp':
+        probe['rtt'], probe['rate'] = tftp_sample(ip, port, image)
+        return probe
+    probe['rtt'] = tcp_rtt(ip, port)
+    if probe['rtt'] is not None:
+        rate = http_rate if transport == 'http' else sample_rate
+        probe['rate'] = rate(ip, port, image)
+    return probe
+
+
+# expected seconds to pull size bytes from a probed mirror
+def transfer_seconds(probe, size):
+    if probe['rtt'] is None or not probe['rate']:
+        return None
+    return probe['rtt'] * SETUP_RTTS + size / probe['rate']
+
+
+# Mirror probes and assignments shared by every host of a run
+class MirrorSelector(object):
+    def __init__(self, workers=16):
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        # {probe_key: future of the probe}, each mirror is probed once
+        self.probes = {}
+        # hosts assigned per mirror ip
+        self.load = {}
+
+    # upgrade image and mirrors of a host
+    def _host(self, host):
+        img = model_data(host, host['sw_model'])['upgrade_img']
+        return img, host_mirrors(host)
+
+    # start probes for the mirrors of the hosts, returns {probe_key: probe}
+    def probe(self, hosts):
+        keys = []
+        with self.lock:
+            for host in hosts:
+                img, mirrors = self._host(host)
+                for mirror in mirrors:
+                    key = probe_key(mirror)
+                    if key not in self.probes:
+                        self.probes[key] = self.pool.submit(probe_mirror, mirror, img)
+                    keys.append(key)
+        return {key: self.probes[key].result() for key in keys}
+
+    # assign the mirror that finishes the host's transfer first, returns its ip
+    def assign(self, host):
+        img, mirrors = self._host(host)
+        if not mirrors:
+            return None
+        probes = self.probe([host])
+        size = image_size(host, img) or DEFAULT_SIZE
+        with self.lock:
+            best = None
+            for mirror in mirrors:
+                seconds = transfer_seconds(probes[probe_key(mirror)], size)
+                if seconds is None:
+                    continue
+                # hosts past the connection cap wait for a full transfer round
+                rounds = math.ceil((self.load.get(mirror['ip'], 0) + 1) / mirror['cons'])
+                cost = seconds * rounds
+                if best is None or cost < best[0]:
+                    best = (cost, mirror)
+            if best is None:
+                return None
+            mirror = best[1]
+            self.load[mirror['ip']] = self.load.get(mirror['ip'], 0) + 1
+        host['image_server'] = mirror['ip']
+        host['image_server_port'] = mirror['port']
+        host['image_server_cons'] = mirror['cons']
+        return mirror['ip']
+
+
+def print_probes(probes):
+    print(f"{'mirror':<20}{'transport':>10}{'rtt ms':>10}{'MB/s':>10}")
+    for (ip, transport, port), probe in sorted(probes.items()):
+        rtt = f"{probe['rtt'] * 1000:.1f}" if probe['rtt'] is not None else 'down'
+        rate = f"{probe['rate'] / 1024 / 1024:.1f}" if probe['rate'] else '-'
+        print(f"{ip:<20}{transport:>10}{rtt:>10}{rate:>10}")
+
+
+# probe the mirrors of the hosts to upgrade and assign one to each host
+def select_mirrors(nr, selector=None):
+    selector = selector or MirrorSelector()
+    hosts = [h for h in nr.inventory.hosts.values()
+             if h.get('upgrade') == True and not h.get('pending_reload')]
+    if not any(host_mirrors(host) for host in hosts):
+        return {}
+
+    c_print('Probing image mirrors')
+    print_probes(selector.probe(hosts))
+
+    assigned = {}
+    for host in hosts:
+        ip = selector.assign(host)
+        if ip:
+            assigned[host.name] = ip
+    counts = {}
+    for ip in assigned.values():
+        counts[ip] = counts.get(ip, 0) + 1
+    c_print('Hosts per mirror: ' +
+            ', '.join(f'{ip} {n}' for ip, n in sorted(counts.items())))
+    for host in hosts:
+        if host.name not in assigned and host_mirrors(host):
+            print(f"{host}: no reachable mirror, using its inventory server")
+    print('~'*80)
+    return assigned
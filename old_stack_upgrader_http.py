@@ -19,30 +19,13 @@ C9300:
 
 '''
 
-import threading
-import socketserver
 import os, sys, time, socket
 from getpass import getpass
 from nornir import InitNornir
 from nornir.plugins.tasks.networking import netmiko_send_command
 from nornir.plugins.tasks.networking import netmiko_save_config
-from http.server import SimpleHTTPRequestHandler
-
-
-# HTTP server for file transfer
-class ThreadedHTTPServer(object):
-    handler = SimpleHTTPRequestHandler
-    def __init__(self, host, port):
-        self.server = socketserver.TCPServer((host, port), self.handler)
-        self.server_thread = threading.Thread(target=self.server.serve_forever)
-        self.server_thread.daemon = True
-
-    def start(self):
-        self.server_thread.start()
-
-    def stop(self):
-        self.server.shutdown()
-        self.server.server_close()
+from image_server import ThreadedHTTPServer
+from transports import transport_url
 
 
 # Print formatting function
@@ -135,19 +118,19 @@ def stack_upgrader(task):
         # upgrade commands based on switch hardware model 
         if '3750' in sw_model:
             cmd = f"archive download-sw /imageonly /allow-feature-upgrade /safe " + \
-                f"ftp://{task.host['http_ip']}/{upgrade_img}"
+                transport_url(task.host, 'http', upgrade_img)
 
         elif '3650' in sw_model or '3850' in sw_model:
             if task.host['current_version'].startswith("16"):
                 cmd = f"request platform software package install switch all file " + \
-                    f"ftp://{task.host['http_ip']}/{upgrade_img} new auto-copy"
+                    transport_url(task.host, 'http', upgrade_img) + " new auto-copy"
             else:
                 cmd = f"archive download-sw /imageonly /allow-feature-upgrade /safe " + \
-                    f"ftp://{task.host['http_ip']}/{upgrade_img}"
+                    transport_url(task.host, 'http', upgrade_img)
 
         elif '9300' in sw_model:
                 cmd = f"request platform software package install switch all file " + \
-                    f"ftp://{task.host['http_ip']}/{upgrade_img} on-reboot"
+                    transport_url(task.host, 'http', upgrade_img) + " on-reboot"
 
     print(cmd)
     print()
@@ -210,7 +193,8 @@ def main():
     # set http server ip
     http_svr = nr.inventory.defaults.data['http_ip']
     # init http server
-    server = ThreadedHTTPServer(http_svr, 8000)
+    max_clients = nr.inventory.defaults.data.get('http_max_clients', 64)
+    server = ThreadedHTTPServer(http_svr, 8000, "/images", max_clients)
     # start http server
     server.start()
     print('~'*80)
@@ -9,7 +9,7 @@ from nornir.core.filter import F
 from nornir.plugins.functions.text import print_result
 from nornir.plugins.tasks.networking import netmiko_send_config
 from nornir.plugins.tasks.networking import netmiko_send_command
-from nornir.plugins.tasks.networking import netmiko_file_transfer
+from push import push_image
 from pprint import pprint as pp
 
 # Run show commands on each switch
@@ -67,12 +67,10 @@ def file_copy(task):
     # upgraded image to be used
     img_file = task.host['upgrade_img']
 
-    # transfer image file to switch
+    # transfer image file to switch, skipped if present, resumed if partial
     transfer = task.run(
-        task=netmiko_file_transfer,
-        source_file=f"images/{img_file}",
-        dest_file=img_file,
-        direction='put',
+        task=push_image,
+        img=img_file,
     )
 
     # verify md5 hash of new file
@@ -86,11 +84,10 @@ def file_copy(task):
     print(f"{task.host}: {md5[1]} verified = {task.host['md5_verified']}")
     
     # print message if transfer successful
-    if transfer.result == True:
-        print(f"{task.host}: IOS image file has been transferred.")
-    # print message if transfer fails
-    elif transfer.result == False:
-        print(f"{task.host}: IOS image file transfer has failed.")
+    if transfer.result == 'present':
+        print(f"{task.host}: IOS image file already on flash.")
+    else:
+        print(f"{task.host}: IOS image file has been transferred ({transfer.result}).")
 
 
 # Stack upgrader main function
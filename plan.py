@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+'''
+Offline fleet upgrade plan compiler.
+
+Resolves, for the whole inventory in one pass and without any SSH session,
+the group data for each switch model, the upgrade image, the image mirror
+(mirrors.py), the transfer URL and the exact install command. The plan is written to a JSON file that
+stack_upgrader.py --plan runs unchanged.
+
+Usage:
+
+    python3 plan.py [site] [--out upgrade_plan.json]
+'''
+
+import sys
+import json
+import time
+import argparse
+from flash_check import image_size, flash_shortfall, mb
+from versions import classify
+from transports import transport_for, transport_url
+
+
+PLAN_FILE = 'upgrade_plan.json'
+# mirror assignment kept in a plan step
+MIRROR_KEYS = ('image_server', 'image_server_port', 'image_server_cons')
+
+
+class PlanError(Exception):
+    pass
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+# group data for a model, e.g. C3750X may be stored as C3750X or cat3750x
+def model_data(host, sw_model):
+    for key in (sw_model, 'cat' + sw_model[1:].lower(), sw_model.lower()):
+        data = host.get(key)
+        if data:
+            return data
+    raise PlanError(f'{host}: no upgrade data for model {sw_model} in inventory')
+
+
+# image source for the host's transport, from its mirror if one was assigned
+def image_url(host, upgrade_img):
+    return transport_url(host, transport_for(host), upgrade_img)
+
+
+# upgrade command based on switch hardware model
+def upgrade_command(sw_model, current_version, url):
+    if '3750' in sw_model:
+        return f"archive download-sw /imageonly /allow-feature-upgrade /safe {url}"
+
+    elif '3650' in sw_model or '3850' in sw_model:
+        if current_version.startswith("16"):
+            return f"request platform software package install switch all file {url} new auto-copy"
+        return f"archive download-sw /imageonly /allow-feature-upgrade /safe {url}"
+
+    elif '9300' in sw_model:
+        return f"request platform software package install switch all file {url} on-reboot"
+
+    raise PlanError(f'no upgrade command for model {sw_model}')
+
+
+# plan step for one host from the facts in its host data, mirrors is a
+# MirrorSelector to pick the image server with
+def plan_host(host, mirrors=None):
+    sw_model = host['sw_model']
+    data = model_data(host, sw_model)
+    current = host['current_version']
+    desired = data['upgrade_version']
+    action = classify(current, desired, bool(host.get('allow_downgrade')))
+    step = {
+        'model': sw_model,
+        'current_version': current,
+        'upgrade_version': desired,
+        'action': action,
+        'upgrade': action in ('upgrade', 'downgrade'),
+        'upgrade_img': data['upgrade_img'],
+    }
+    if step['upgrade']:
+        # exclude hosts that would run out of flash part way through
+        shortfall = flash_shortfall(
+            host.get('flash'), sw_model, image_size(host, data['upgrade_img']))
+        if shortfall:
+            short = ', '.join(f'{fs} {mb(missing)}' for fs, missing in sorted(shortfall.items()))
+            raise PlanError(f'not enough flash for {data["upgrade_img"]}: {short} short')
+        if mirrors and mirrors.assign(host):
+            for key in MIRROR_KEYS:
+                step[key] = host[key]
+        step['url'] = image_url(host, data['upgrade_img'])
+        step['cmd'] = upgrade_command(sw_model, current, step['url'])
+    return step
+
+
+# compile a plan for every host from cached facts
+def compile_plan(nr, cache, keys=('sh_version', 'current_version', 'sw_model'), mirrors=None):
+    plan = {'created': time.time(), 'hosts': {}, 'errors': {}}
+    for name, host in nr.inventory.hosts.items():
+        if not cache.restore(host, keys, cache.ttl):
+            plan['errors'][name] = 'no cached facts, run a check first'
+            continue
+        # flash facts are only cached by stack_upgrader.py
+        cache.restore(host, ['flash'], cache.ttl)
+        try:
+            plan['hosts'][name] = plan_host(host, mirrors)
+        except (PlanError, KeyError) as e:
+            plan['errors'][name] = str(e)
+    return plan
+
+
+def write_plan(plan, path=PLAN_FILE):
+    with open(path, 'w') as f:
+        json.dump(plan, f, indent=2, sort_keys=True)
+
+
+def load_plan(path=PLAN_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+# load plan steps into host data, hosts not in the plan are dropped
+def apply_plan(nr, plan):
+    for name, step in plan['hosts'].items():
+        if name not in nr.inventory.hosts:
+            continue
+        host = nr.inventory.hosts[name]
+        host['sw_model'] = step['model']
+        host['current_version'] = step['current_version']
+        host['upgrade'] = step['upgrade']
+        host['upgrade_cmd'] = step.get('cmd')
+        # the mirror the command pulls from, for the scheduler caps
+        for key in MIRROR_KEYS:
+            if key in step:
+                host[key] = step[key]
+    return nr.filter(filter_func=lambda h: h.name in plan['hosts'])
+
+
+def print_plan(plan):
+    c_print('*** Upgrade plan ***')
+    for name, step in sorted(plan['hosts'].items()):
+        if step['upgrade']:
+            print(f"{name}: {step['current_version']} -> {step['upgrade_version']}")
+            print(f"{' ' *4}{step['cmd']}")
+        elif step.get('action') == 'newer':
+            print(f"{name}: running {step['current_version']} newer than " +
+                  f"{step['upgrade_version']}, skipped")
+        else:
+            print(f"{name}: running {step['current_version']} upgrade NOT needed")
+    if plan['errors']:
+        c_print('*** Hosts that can not be planned ***')
+        for name, error in sorted(plan['errors'].items()):
+            print(f"{name}: {error}")
+
+
+def main():
+    # imported here so the plan helpers load without the upgrader
+    from stack_upgrader import kickoff
+    from facts_cache import FactsCache
+    from mirrors import MirrorSelector
+
+    parser = argparse.ArgumentParser(description='Compile an offline upgrade plan')
+    parser.add_argument('site', nargs='?', default='',
+        help='inventory site prefix, loads inventory/{site}_hosts.yaml')
+    parser.add_argument('--out', default=PLAN_FILE, help='plan file to write')
+    args = parser.parse_args()
+
+    nr = kickoff(args.site)
+    plan = compile_plan(nr, FactsCache(), mirrors=MirrorSelector())
+    print_plan(plan)
+    write_plan(plan, args.out)
+    c_print(f'Plan written to {args.out}')
+    print('~'*80)
+    if plan['errors']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+'''
+Resumable orchestrator-side image push.
+
+push_image puts an image on switch flash from the local image directory
+for sites without an image server:
+
+    - the remote size and MD5 are checked first, an image already fully
+      present with the catalog MD5 is skipped
+    - a partial image left by an interrupted push is kept when its MD5
+      matches the MD5 of the same number of leading bytes of the local
+      image, and only the missing tail is sent
+    - data is written over SFTP in chunks through a token bucket shared by
+      every host, so parallel pushes stay under one bandwidth cap
+    - switches without an SFTP server get a full SCP push instead, paced by
+      the same token bucket; SCP can not append, so an interrupted SCP push
+      starts over from the first byte
+
+Optional inventory data (defaults, group or host level):
+
+push_mbps: 200        # bandwidth cap shared by all parallel pushes
+'''
+
+import os
+import re
+import time
+import hashlib
+import threading
+import paramiko
+from functools import lru_cache
+from nornir.core.task import Result
+from nornir.plugins.tasks.networking import netmiko_send_command
+from nornir.plugins.tasks.networking import netmiko_file_transfer
+from image_catalog import ImageCatalog, verify_md5
+from flash_check import image_dir
+
+
+# bytes written per SFTP request
+CHUNK = 1024 * 1024
+DEFAULT_MBPS = 200
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+# Token bucket in bytes, shared by the threads pushing images
+class TokenBucket(object):
+    def __init__(self, mbps):
+        self.rate = mbps * 1000 * 1000 / 8
+        # up to one second of burst
+        self.capacity = self.rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # block until nbytes may be sent
+    def take(self, nbytes):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= nbytes or self.tokens >= self.capacity:
+                    self.tokens -= nbytes
+                    return
+                wait = (nbytes - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# one bucket per cap, shared by every host with the same push_mbps
+@lru_cache(maxsize=None)
+def shared_bucket(mbps):
+    return TokenBucket(mbps)
+
+
+# image catalog per image directory
+@lru_cache(maxsize=None)
+def catalog_for(directory):
+    return ImageCatalog(directory)
+
+
+# MD5 of the first size bytes of a local file
+def prefix_md5(path, size):
+    md5 = hashlib.md5()
+    left = size
+    with open(path, 'rb') as f:
+        while left > 0:
+            data = f.read(min(CHUNK * 16, left))
+            if not data:
+                break
+            md5.update(data)
+            left -= len(data)
+    return md5.hexdigest()
+
+
+# size of a file on flash, 0 if it is not there
+def remote_size(task, fs, img):
+    listing = task.run(
+        task=netmiko_send_command,
+        command_string=f"dir {fs}:{img}",
+    )
+    m = re.search(rf'-[rwxd-]+\s+(\d+)\s.*{re.escape(img)}\s*$', listing.result, re.M)
+    return int(m.group(1)) if m else 0
+
+
+def remote_md5(task, fs, img):
+    verify = task.run(
+        task=netmiko_send_command,
+        command_string=f"verify /md5 {fs}:{img}",
+        delay_factor=6,
+    )
+    return verify_md5(verify.result)
+
+
+# SFTP session on the open netmiko connection, None if the switch has no
+# SFTP server ("ip scp server enable" only gives SCP)
+def open_sftp(conn):
+    try:
+        return conn.remote_conn_pre.open_sftp()
+    except paramiko.SSHException:
+        return None
+
+
+# write the local file from offset over an SFTP session
+def sftp_write(sftp, source, dest, offset, bucket):
+    with open(source, 'rb') as src, sftp.open(dest, 'ab' if offset else 'wb') as dst:
+        dst.set_pipelined(True)
+        src.seek(offset)
+        while True:
+            data = src.read(CHUNK)
+            if not data:
+                break
+            bucket.take(len(data))
+            dst.write(data)
+
+
+# SCP progress callback that holds the sending thread in the token bucket
+def scp_throttle(bucket):
+    sent_before = [0]
+
+    def _progress(filename, size, sent):
+        bucket.take(sent - sent_before[0])
+        sent_before[0] = sent
+
+    return _progress
+
+
+# Push an image to flash, skipping or resuming what is already there
+def push_image(task, img, fs='flash'):
+    source = os.path.join(image_dir(task.host), img)
+    size = os.path.getsize(source)
+    # catalog MD5, hashed here for images the catalog does not know
+    expected = catalog_for(image_dir(task.host)).md5(img) or prefix_md5(source, size)
+    bucket = shared_bucket(task.host.get('push_mbps') or DEFAULT_MBPS)
+
+    # already fully present
+    have = remote_size(task, fs, img)
+    if have == size and remote_md5(task, fs, img) == expected:
+        print(f"{task.host}: {fs}:{img} already present, push skipped")
+        return Result(host=task.host, result='present')
+
+    # keep a partial image only if it is a prefix of the local one
+    offset = 0
+    if 0 < have < size and remote_md5(task, fs, img) == prefix_md5(source, have):
+        offset = have
+        print(f"{task.host}: resuming {img} at {offset} of {size} bytes")
+
+    conn = task.host.get_connection("netmiko", task.nornir.config)
+    c_print(f"*** {task.host}: pushing {img} to {fs}: ***")
+    sftp = open_sftp(conn)
+    if sftp:
+        try:
+            sftp_write(sftp, source, f"{fs}:/{img}", offset, bucket)
+        finally:
+            sftp.close()
+        how = 'resumed' if offset else 'sftp'
+    else:
+        # no SFTP server on the switch, full SCP push under the same cap
+        print(f"{task.host}: no SFTP server, pushing {size} bytes with SCP")
+        task.run(
+            task=netmiko_file_transfer,
+            source_file=source,
+            dest_file=img,
+            file_system=f"{fs}:",
+            direction='put',
+            overwrite_file=True,
+            progress=scp_throttle(bucket),
+        )
+        how = 'scp'
+
+    md5 = remote_md5(task, fs, img)
+    return Result(
+        host=task.host,
+        result=how,
+        changed=True,
+        failed=md5 != expected,
+    )
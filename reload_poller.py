@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+'''
+Concurrent post-reload readiness poller.
+
+Every reloaded host is probed at the same time with asyncio, first with a
+TCP connect to port 22 and then with an SSH login. Probes back off between
+attempts and give up once the per-model boot time budget is spent. When a
+host is back, "show version" is parsed again and compared to the model's
+upgrade_version.
+
+Optional inventory data (defaults, group or host level):
+
+boot_minutes: 25
+'''
+
+import time
+import asyncio
+from netmiko import ConnectHandler
+from plan import model_data
+from show_parser import parse_output
+from versions import same_version
+
+
+# Boot time budget per switch model in minutes
+BOOT_MINUTES = {
+    'C3750V2': 15,
+    'C3750X': 20,
+    'C3650': 25,
+    'C3850': 25,
+    'C9300': 25,
+}
+DEFAULT_BOOT_MINUTES = 20
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+# boot time budget for a host in seconds
+def boot_budget(host):
+    minutes = host.get('boot_minutes') or \
+        BOOT_MINUTES.get(host.get('sw_model'), DEFAULT_BOOT_MINUTES)
+    return minutes * 60
+
+
+# TCP connect probe, returns True when the port accepts connections
+async def probe_tcp(ip, port=22, timeout=5):
+    try:
+        _reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(ip, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+# SSH login and "show version", blocking so it runs in an executor
+def login_show_version(host):
+    params = host.get_connection_parameters("netmiko")
+    conn = ConnectHandler(
+        host=params.hostname,
+        username=params.username,
+        password=params.password,
+        port=params.port or 22,
+        device_type=params.platform or 'cisco_ios',
+        **(params.extras or {})
+    )
+    try:
+        return parse_output(conn.send_command("show version"), "show version")
+    finally:
+        conn.disconnect()
+
+
+# Wait for one host to come back and verify its version
+async def wait_for_host(host, loop, holddown=60, first_delay=10, max_delay=60):
+    started = host.get('reload_time') or time.time()
+    deadline = started + boot_budget(host)
+    sw_model = host.get('sw_model')
+    desired = model_data(host, sw_model)['upgrade_version']
+    report = {
+        'host': host.name,
+        'model': sw_model,
+        'desired': desired,
+        'version': None,
+        'minutes': None,
+        'status': 'timeout',
+    }
+
+    # the old image keeps answering for a moment after "reload"
+    wait = started + holddown - time.time()
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+    delay = first_delay
+    while time.time() < deadline:
+        params = host.get_connection_parameters("netmiko")
+        # cheap TCP probe first, only try SSH when port 22 is open
+        if await probe_tcp(params.hostname, params.port or 22):
+            try:
+                sh_version = await loop.run_in_executor(None, login_show_version, host)
+            except Exception:
+                sh_version = None
+            if isinstance(sh_version, list) and sh_version:
+                report['version'] = sh_version[0]['version']
+                report['minutes'] = round((time.time() - started) / 60, 1)
+                if same_version(report['version'], desired):
+                    report['status'] = 'pass'
+                else:
+                    report['status'] = 'fail'
+                return report
+        # back off between probes
+        await asyncio.sleep(min(delay, max(0, deadline - time.time())))
+        delay = min(delay * 1.5, max_delay)
+
+    report['minutes'] = round((time.time() - started) / 60, 1)
+    return report
+
+
+# Poll all hosts concurrently
+async def _poll(hosts, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(
+        *[wait_for_host(host, loop, **kwargs) for host in hosts])
+
+
+# Poll reloaded hosts in a Nornir object and print a recovery report
+def poll_reloaded(nr, **kwargs):
+    hosts = [h for h in nr.inventory.hosts.values() if h.get('reload_time')]
+    if not hosts:
+        return []
+
+    c_print(f'Waiting for {len(hosts)} reloaded switch stacks')
+    reports = asyncio.run(_poll(hosts, **kwargs))
+    print_report(reports)
+    return reports
+
+
+# Print per host time to recovery and version check
+def print_report(reports):
+    c_print('*** Post-reload report ***')
+    print(f"{'host':<24}{'model':<10}{'version':<16}{'minutes':>8}  status")
+    for r in sorted(reports, key=lambda r: r['host']):
+        minutes = '-' if r['minutes'] is None else r['minutes']
+        print(f"{r['host']:<24}{str(r['model']):<10}{str(r['version']):<16}" +
+              f"{minutes:>8}  {r['status']}")
+    passed = len([r for r in reports if r['status'] == 'pass'])
+    c_print(f'{passed}/{len(reports)} stacks back on the desired version')
@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+'''
+Bandwidth aware upgrade scheduler for Nornir image transfers.
+
+Hosts are started one at a time as soon as a slot frees up, subject to:
+
+    - a connection cap per image server (ftp_ip, or image_server with its
+      image_server_cons cap when a mirror was assigned)
+    - a bandwidth budget per site / WAN link (Mbps)
+    - a concurrency cap per switch model
+
+Optional inventory data (defaults, group or host level):
+
+scheduler:
+    max_workers: 20
+    server_cons: 8
+    transfer_mbps: 20
+    site_mbps: 100
+    model_cons:
+        C3750X: 4
+        C9300: 10
+
+Hosts may override 'site', 'site_mbps' and 'transfer_mbps' in their own data.
+
+Schedulers for several sites can share a global limit, a semaphore that
+caps running hosts across all of them.
+'''
+
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from nornir.core import Nornir
+from nornir.core.inventory import Inventory
+
+
+# Scheduler defaults used when inventory has no "scheduler" data
+DEFAULTS = {
+    'max_workers': 20,
+    'server_cons': 8,
+    'transfer_mbps': 20,
+    'site_mbps': None,
+    'model_cons': {},
+}
+
+
+# caps must let at least one host through
+def check_cap(name, cap):
+    if not isinstance(cap, int) or cap < 1:
+        raise ValueError(f'scheduler {name} must be at least 1, got {cap!r}')
+
+
+# Slot request for a single host
+class Demand(object):
+    def __init__(self, name, server, site, model, mbps, server_cons=None):
+        self.name = name
+        self.server = server
+        self.server_cons = server_cons
+        self.site = site
+        self.model = model
+        self.mbps = mbps
+
+
+class UpgradeScheduler(object):
+    def __init__(self, max_workers=20, server_cons=8, transfer_mbps=20,
+                 site_mbps=None, model_cons=None, limit=None):
+        # a cap below one never fits and would stall the run
+        caps = dict(max_workers=max_workers, server_cons=server_cons)
+        caps.update({f'model_cons {model}': cap for model, cap in (model_cons or {}).items()})
+        for name, cap in caps.items():
+            check_cap(name, cap)
+        self.max_workers = max_workers
+        self.limit = limit
+        self.server_cons = server_cons
+        self.transfer_mbps = transfer_mbps
+        self.site_mbps = site_mbps
+        self.model_cons = model_cons or {}
+        # running totals keyed by server / site / model
+        self.cond = threading.Condition()
+        self.running = 0
+        self.server_use = {}
+        self.site_use = {}
+        self.model_use = {}
+
+    # build scheduler from inventory defaults data
+    @classmethod
+    def from_inventory(cls, nr, limit=None):
+        opts = dict(DEFAULTS)
+        opts.update(nr.inventory.defaults.data.get('scheduler') or {})
+        return cls(limit=limit, **opts)
+
+    # describe what a host needs from the shared limits
+    def demand(self, host):
+        opts = host.get('scheduler') or {}
+        groups = list(host.groups)
+        site = host.get('site') or (groups[0] if groups else 'default')
+        if host.get('image_server_cons') is not None:
+            check_cap(f'image_server_cons of {host.name}', host.get('image_server_cons'))
+        return Demand(
+            name=host.name,
+            server=host.get('image_server') or host.get('ftp_ip'),
+            site=site,
+            model=host.get('sw_model'),
+            mbps=host.get('transfer_mbps') or opts.get('transfer_mbps') or self.transfer_mbps,
+            server_cons=host.get('image_server_cons') or self.server_cons,
+        )
+
+    # site budget for a host, host data wins over scheduler default
+    def _site_budget(self, host):
+        return host.get('site_mbps') or self.site_mbps
+
+    # check whether a demand fits in the current free capacity
+    def _fits(self, demand, budget=None):
+        if self.running >= self.max_workers:
+            return False
+        # server connection cap
+        if demand.server and self.server_use.get(demand.server, 0) >= demand.server_cons:
+            return False
+        # model cap
+        cap = self.model_cons.get(demand.model)
+        if cap and self.model_use.get(demand.model, 0) >= cap:
+            return False
+        # site bandwidth budget, always let one transfer through so an
+        # undersized budget can not stall the site
+        budget = budget or self.site_mbps
+        used = self.site_use.get(demand.site, 0)
+        if budget and used and used + demand.mbps > budget:
+            return False
+        return True
+
+    def _take(self, demand):
+        self.running += 1
+        self.server_use[demand.server] = self.server_use.get(demand.server, 0) + 1
+        self.site_use[demand.site] = self.site_use.get(demand.site, 0) + demand.mbps
+        self.model_use[demand.model] = self.model_use.get(demand.model, 0) + 1
+
+    def _give(self, demand):
+        with self.cond:
+            self.running -= 1
+            self.server_use[demand.server] -= 1
+            self.site_use[demand.site] -= demand.mbps
+            self.model_use[demand.model] -= 1
+            self.cond.notify_all()
+
+    # idle scheduler with the same caps, for planning ahead of a run
+    def copy(self):
+        return UpgradeScheduler(self.max_workers, self.server_cons, self.transfer_mbps,
+                                self.site_mbps, self.model_cons)
+
+    # take a slot for the host if it fits right now, returns the demand or None
+    def try_take(self, host):
+        demand = self.demand(host)
+        with self.cond:
+            if not self._fits(demand, self._site_budget(host)):
+                return None
+            self._take(demand)
+        return demand
+
+    def release(self, demand):
+        self._give(demand)
+
+    # block until the host fits, used from inside a running Nornir task
+    @contextmanager
+    def slot(self, host):
+        demand = self.demand(host)
+        budget = self._site_budget(host)
+        with self.cond:
+            while not self._fits(demand, budget):
+                self.cond.wait()
+            self._take(demand)
+        try:
+            # shared limit across sites, taken after the local slot
+            if self.limit:
+                with self.limit:
+                    yield demand
+            else:
+                yield demand
+        finally:
+            self._give(demand)
+
+    # run a task on every host, starting the next eligible host whenever a
+    # slot frees up instead of in fixed batches, order is an optional list of
+    # host names to start first
+    def run(self, nr, task, order=None, **kwargs):
+        # callers may have narrowed max_workers after construction
+        check_cap('max_workers', self.max_workers)
+        pending = [nr.inventory.hosts[name] for name in nr.inventory.hosts]
+        if order:
+            rank = {name: i for i, name in enumerate(order)}
+            pending.sort(key=lambda h: rank.get(h.name, len(rank)))
+        # hosts with the same demand fit or block together, so each wakeup
+        # only has to check the head of every queue
+        queues = {}
+        for position, host in enumerate(pending):
+            demand = self.demand(host)
+            budget = self._site_budget(host)
+            key = (demand.server, demand.server_cons, demand.site, demand.model,
+                   demand.mbps, budget)
+            queues.setdefault(key, deque()).append((position, host, demand, budget))
+        results = {}
+        futures = []
+
+        def _work(host, demand):
+            try:
+                if self.limit:
+                    self.limit.acquire()
+                try:
+                    # single host Nornir without scanning the inventory
+                    single = Nornir(**nr.__dict__)
+                    single.inventory = Inventory(
+                        hosts={host.name: host},
+                        groups=nr.inventory.groups,
+                        defaults=nr.inventory.defaults,
+                    )
+                    results.update(single.run(task=task, num_workers=1, **kwargs))
+                finally:
+                    if self.limit:
+                        self.limit.release()
+            finally:
+                self._give(demand)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while queues:
+                with self.cond:
+                    # first pending host that fits, skipping blocked ones so a
+                    # saturated model or site does not hold up the rest
+                    picked = None
+                    while picked is None:
+                        for key, queue in queues.items():
+                            position, host, demand, budget = queue[0]
+                            if (picked is None or position < picked[1]) and \
+                                    self._fits(demand, budget):
+                                picked = (key, position)
+                        if picked is None:
+                            self.cond.wait()
+                    key = picked[0]
+                    position, host, demand, budget = queues[key].popleft()
+                    if not queues[key]:
+                        del queues[key]
+                    self._take(demand)
+                futures.append(pool.submit(_work, host, demand))
+
+        # raise errors from the worker threads instead of dropping them
+        for future in futures:
+            future.result()
+        return results
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+'''
+Fast parsers for the "show version" and "show boot" fields the upgrade
+scripts actually use.
+
+Precompiled regexes pull hostname, version, hardware, serial, running image,
+uptime and config register from IOS 12.2 / 15.x and IOS-XE 16.x output, and
+the boot path from "show boot". The result has the same shape as the
+ntc-templates TextFSM output, a list with one dict, so callers are unchanged.
+TextFSM is only used when the fast parser cannot find a required field.
+'''
+
+import re
+
+
+# line regexes by first character, lines are matched one at a time so each
+# regex only runs on the few lines that can hold its field
+# "Cisco IOS Software, C3750 Software (C3750-IPBASEK9-M), Version 12.2(55)SE12, ..."
+# the IOS-XE "Cisco IOS XE Software, Version 16.09.04" line is skipped, textfsm
+# also reports the 16.9.4 form
+VERSION_RE = re.compile(r'(?:Cisco IOS Software|IOS \(tm\)).*?,\s+Version\s+([^,\s]+)')
+IMAGE_RE = re.compile(r'[Ss]ystem image file is "[^:"]*:([^"]+)"')
+PROCESSOR_RE = re.compile(r'[Cc]isco\s+(\S+)\s+\(.+\)\s+processor')
+HARDWARE_RE = re.compile(r'[Mm]odel [Nn]umber\s*:\s*(\S+)')
+SERIAL_RE = re.compile(r'[Ss]ystem [Ss]erial [Nn]umber\s*:\s*(\S+)')
+REGISTER_RE = re.compile(r'[Cc]onfiguration register is\s+(\S+)')
+UPTIME_RE = re.compile(r'(\S+)\s+uptime is\s+(.+?)\s*$')
+
+# one entry per stack member
+LIST_FIELDS = ('hardware', 'processor', 'serial')
+
+LINE_RES = {}
+for field, regex, firsts in (
+        ('version', VERSION_RE, 'CI'),
+        ('running_image', IMAGE_RE, 'Ss'),
+        ('processor', PROCESSOR_RE, 'Cc'),
+        ('hardware', HARDWARE_RE, 'Mm'),
+        ('serial', SERIAL_RE, 'Ss'),
+        ('config_register', REGISTER_RE, 'Cc')):
+    for first in firsts:
+        LINE_RES.setdefault(first, []).append((field, regex))
+
+# "BOOT path-list : flash:/c3750e.../c3750e...bin" on IOS,
+# "BOOT variable = flash:packages.conf;" on IOS-XE
+BOOT_PATH_RE = re.compile(r'^BOOT path-list\s*:[ \t]*(\S+)', re.M)
+BOOT_NEXT_RE = re.compile(
+    r'^Boot Variables on next reload:\s*\nBOOT variable\s*=[ \t]*([^;\s]+)', re.M)
+BOOT_VAR_RE = re.compile(r'^BOOT variable\s*=[ \t]*([^;\s]+)', re.M)
+
+
+# show version to a textfsm shaped list, None if a used field is missing
+def parse_show_version(output):
+    found = {field: [] for field in LIST_FIELDS}
+    for line in output.splitlines():
+        line = line.lstrip()
+        if 'uptime' not in found and ' uptime is ' in line:
+            match = UPTIME_RE.match(line)
+            if match:
+                found['hostname'], found['uptime'] = match.groups()
+                continue
+        for field, regex in LINE_RES.get(line[:1], ()):
+            if field in found and field not in LIST_FIELDS:
+                continue
+            match = regex.match(line)
+            if match:
+                if field in LIST_FIELDS:
+                    found[field].append(match.group(1))
+                else:
+                    found[field] = match.group(1)
+                break
+
+    # "cisco WS-C3750X-24 (...) processor" first, as textfsm does
+    hardware = found['processor'] or found['hardware']
+    if 'version' not in found or not hardware:
+        return None
+    return [{
+        'hostname': found.get('hostname', ''),
+        'version': found['version'],
+        'hardware': hardware,
+        'serial': found['serial'],
+        'running_image': found.get('running_image', ''),
+        'uptime': found.get('uptime', ''),
+        'config_register': found.get('config_register', ''),
+    }]
+
+
+# show boot to a textfsm shaped list, None if there is no boot path
+def parse_show_boot(output):
+    boot = BOOT_PATH_RE.search(output) or BOOT_NEXT_RE.search(output) or \
+        BOOT_VAR_RE.search(output)
+    if not boot:
+        return None
+    return [{'boot_path': boot.group(1)}]
+
+
+PARSERS = {
+    'show version': parse_show_version,
+    'show boot': parse_show_boot,
+}
+
+
+# TextFSM through netmiko / ntc-templates, only for output the fast parser missed
+def parse_textfsm(output, command_string, platform='cisco_ios'):
+    from netmiko.utilities import get_structured_data
+    return get_structured_data(output, platform=platform, command=command_string)
+
+
+# fast parser first, TextFSM fallback
+def parse_output(output, command_string):
+    parsed = PARSERS[command_string](output)
+    if parsed is None:
+        parsed = parse_textfsm(output, command_string)
+    return parsed
+
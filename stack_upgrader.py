@@ -19,11 +19,40 @@ C9300:
 
 '''
 
-import os, sys, time
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 from nornir import InitNornir
 from nornir.plugins.tasks.networking import netmiko_send_command
 from nornir.plugins.tasks.networking import netmiko_save_config
+from nornir.core.task import Result
+from scheduler import UpgradeScheduler
+from reload_poller import poll_reloaded
+from upgrade_stream import stream_command
+from facts_cache import FactsCache
+from flash_check import FLASH_CMD, parse_flash, image_size, flash_shortfall, mb
+from image_catalog import ImageCatalog, verify_md5
+from metrics import PhaseTimer, METRICS_FILE
+from deadline import DeadlinePlanner, DeadlineGate, parse_window_end
+from deadline import UPGRADE_PHASES, RELOAD_PHASES
+from waves import build_waves, failure_rate
+from inventory_cache import filter_index
+from plan import model_data, plan_host, upgrade_command, load_plan, apply_plan, print_plan
+from staging import stage_image, staged_url, remove_staged
+from journal import PhaseJournal, JOURNAL_FILE, done
+from versions import classify
+from install_state import INSTALL_CMDS, is_xe, batch_pending, flag_pending
+from mirrors import select_mirrors, MirrorSelector
+from transports import transport_for, copy_image
+from show_parser import parse_output
+from batch_show import send_batch
+
+
+# Host facts kept in the facts cache
+FACT_KEYS = ['sh_version', 'current_version', 'sw_model', 'sh_flash', 'flash',
+             'pending_version']
 
 
 # Print formatting function
@@ -32,14 +61,24 @@ def c_print(printme):
     print(f"\n" + printme.center(80, ' ') + "\n")
 
 
+# one question at a time, pipeline gates ask from many threads
+PROMPT_LOCK = threading.Lock()
+
+
+# Ask operator to confirm, returns True / False
+def confirm(banner='********** PROCEED? **********'):
+    with PROMPT_LOCK:
+        # print banner to proceed
+        c_print(banner)
+        # capture user input
+        answer = input(" "*36 + '(y/n) ')
+    return answer.lower() == 'y'
+
+
 # Continue banner
 def proceed():
-    # print banner to proceed
-    c_print('********** PROCEED? **********')
-    # capture user input
-    confirm = input(" "*36 + '(y/n) ')
     # quit script if not confirmed
-    if confirm.lower() != 'y':
+    if not confirm():
         c_print("******* EXITING SCRIPT *******")
         print('~'*80)    
         exit()
@@ -47,6 +86,39 @@ def proceed():
         c_print("********* PROCEEDING *********")
 
 
+# Operator approval shared by all host pipelines
+class ApprovalGate(object):
+    def __init__(self, phase, mode='fleet', wave_size=10):
+        # mode is 'fleet' (ask once), 'wave' (ask per wave_size hosts) or 'none'
+        self.phase = phase
+        self.mode = mode
+        self.wave_size = max(1, wave_size)
+        self.lock = threading.Lock()
+        self.arrived = 0
+        self.answers = {}
+
+    # block the calling host until its wave is approved or declined
+    def wait(self, host):
+        if self.mode == 'none':
+            return True
+        with self.lock:
+            # hosts join waves in the order they reach the gate
+            if self.mode == 'wave':
+                wave = self.arrived // self.wave_size
+            else:
+                wave = 0
+            self.arrived += 1
+            if wave not in self.answers:
+                # name what is approved, the upgrade and reload gates share
+                # the operator
+                if self.mode == 'wave':
+                    banner = f'*** {self.phase.upper()} wave {wave + 1}, starting with {host}? ***'
+                else:
+                    banner = f'*** {self.phase.upper()} all hosts, starting with {host}? ***'
+                self.answers[wave] = confirm(banner)
+            return self.answers[wave]
+
+
 # test Nornir textfsm result
 def test_norn_textfsm(task, result):
     # test norn result
@@ -61,23 +133,86 @@ def test_norn(task, result):
         c_print(f'*** {task.host}: ERROR running Nornir task ***')
 
 
+# command line options
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Upgrade software on Cisco Catalyst switch stacks')
+    parser.add_argument('site', nargs='*', default=[],
+        help='inventory site prefix, loads inventory/{site}_hosts.yaml, ' +
+             'several sites run in parallel through the per host pipeline')
+    parser.add_argument('--site-workers', type=int, default=20,
+        help='hosts running at once per site in multi-site mode')
+    parser.add_argument('--global-workers', type=int, default=100,
+        help='transfers running at once across all sites in multi-site mode')
+    parser.add_argument('--pipeline', action='store_true',
+        help='move each host through all phases on its own')
+    parser.add_argument('--approve', choices=['fleet', 'wave', 'none'], default='fleet',
+        help='pipeline approval gate: once, once per wave or never')
+    parser.add_argument('--wave-size', type=int, default=10,
+        help='hosts per approval wave with --approve wave')
+    parser.add_argument('--max-age', type=float, default=None,
+        help='use cached facts younger than this many minutes')
+    parser.add_argument('--plan', default=None,
+        help='run an upgrade plan compiled by plan.py')
+    parser.add_argument('--metrics', default=METRICS_FILE,
+        help='JSON lines file for per host phase timings')
+    parser.add_argument('--window-end', default=None,
+        help='unattended run that must finish by HH:MM or an ISO date and time')
+    parser.add_argument('--waves', action='store_true',
+        help='roll out in a canary wave then geometrically growing waves')
+    parser.add_argument('--canary', type=int, default=1,
+        help='hosts (or sites / groups) in the canary wave')
+    parser.add_argument('--growth', type=float, default=2.0,
+        help='wave size multiplier after each wave')
+    parser.add_argument('--wave-by', choices=['count', 'site', 'group'], default='count',
+        help='build waves from hosts, whole sites or inventory groups')
+    parser.add_argument('--max-failure', type=float, default=0.2,
+        help='halt the rollout when a wave failure rate exceeds this')
+    parser.add_argument('--resume', action='store_true',
+        help='skip hosts and phases the journal records as done')
+    parser.add_argument('--journal', default=JOURNAL_FILE,
+        help='append-only journal of completed phases per host')
+    parser.add_argument('--stage', action='store_true',
+        help='copy and verify images on flash ahead of the window, no install')
+    parser.add_argument('--stage-workers', type=int, default=5,
+        help='hosts staging at once with --stage')
+    args = parser.parse_args()
+    # staging never installs or reloads, the pipeline and multi-site modes do
+    if args.stage and (args.pipeline or len(args.site) > 1):
+        parser.error('--stage runs on one site and can not be combined with ' +
+                     '--pipeline or several sites')
+    # the run modes each replace the upgrade flow, only one applies
+    modes = [flag for flag, on in (('--pipeline', args.pipeline), ('--waves', args.waves),
+                                   ('--window-end', args.window_end), ('--stage', args.stage)) if on]
+    if len(modes) > 1:
+        parser.error(f"{' and '.join(modes)} are separate run modes, use one")
+    # the pipeline checks every host itself, a compiled plan is not used
+    if args.plan and args.pipeline:
+        parser.error('--plan can not be combined with --pipeline')
+    # several sites always run the per host pipeline
+    if len(args.site) > 1:
+        unsupported = [flag for flag, on in (('--plan', args.plan), ('--waves', args.waves),
+                                             ('--window-end', args.window_end)) if on]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} not supported with several sites, " +
+                         'run the sites one at a time')
+    return args
+
+
 # set device credentials
-def kickoff():
+def kickoff(site=''):
     # print banner
     print()
     print('~'*80)
     c_print('This script will upgrade software on Cisco Catalyst switch stacks')
 
-    if len(sys.argv) < 2:
-        site = ""
-
-    else:
-        site = sys.argv[1] + "_"
+    if site:
+        site = site + "_"
 
     # initialize The Norn
     nr = InitNornir(
         inventory={
-            "plugin": "nornir.plugins.inventory.simple.SimpleInventory",
+            "plugin": "inventory_cache.CachedInventory",
             "options": {
                 "host_file": f"inventory/{site}hosts.yaml",
                 "group_file": f"inventory/{site}groups.yaml",
@@ -86,8 +221,8 @@ def kickoff():
         }
     )
     
-    # filter The Norn
-    nr = nr.filter(platform="ios")
+    # filter The Norn through the prebuilt inventory index
+    nr = filter_index(nr, platform="ios")
 
     c_print('Checking inventory for credentials')
     # check for existing credentials in inventory
@@ -106,102 +241,207 @@ def kickoff():
 
 
 # Run show commands on each switch
-def get_info(task):
+def get_info(task, cache=None, max_age=None):
+    # already done before the run was resumed
+    if done(task.host, 'get_info'):
+        print(f"{task.host}: get_info already done, resuming")
+        return
+    # answer from the facts cache when it is fresh enough
+    if cache and max_age is not None and \
+            cache.restore(task.host, FACT_KEYS, max_age):
+        c_print(f'*** {task.host}: using cached facts ***')
+        return
+
     c_print(f'*** {task.host}: running show comands ***')
-    # run "show version" on each host
-    sh_version = task.run(
-        task=netmiko_send_command,
-        command_string="show version",
-        use_textfsm=True,
+    # run "show version", "flash" and the install state in one round trip
+    shows = task.run(
+        task=send_batch,
+        commands=["show version", FLASH_CMD] + INSTALL_CMDS,
     )
+    outputs = shows.result
+    sh_version = parse_output(outputs["show version"], "show version")
     # test Nornir result
-    print(sh_version)
-    test_norn_textfsm(task, sh_version.result)
+    print(outputs["show version"])
+    test_norn_textfsm(task, sh_version)
     # save show version output to task.host
-    task.host['sh_version'] = sh_version.result[0]
+    task.host['sh_version'] = sh_version[0]
     # pull version from show version
     task.host['current_version'] = task.host['sh_version']['version']
 
-    # pull model from show version
+    # pull model from show version, WS-C3850-48P or C9300-48P
     sw_model = task.host['sh_version']['hardware'][0].split("-")
-    sw_model = sw_model[1]
+    sw_model = sw_model[1] if sw_model[0] == 'WS' else sw_model[0]
     task.host['sw_model'] = sw_model
 
-    # run "flash" on each host
-    sh_flash = task.run(
-        task=netmiko_send_command,
-        command_string="show flash: | incl bytes",
-    )
+    # flash on each stack member
+    sh_flash = outputs[FLASH_CMD]
     # test Nornir result
-    test_norn(task, sh_flash.result)
-    print(sh_flash.result)
+    test_norn(task, sh_flash)
+    print(sh_flash)
+    task.host['sh_flash'] = sh_flash
+    # parse free / total bytes per member
+    task.host['flash'] = parse_flash(sh_flash)
+    # IOS-XE release installed and waiting for a reload
+    task.host['pending_version'] = batch_pending(
+        sw_model, outputs, task.host['current_version'])
+
+    # save facts for later runs
+    if cache:
+        cache.store(task.host, FACT_KEYS)
+
 
 # Compare current and desired software version
 def check_ver(task):
+    # already done before the run was resumed
+    if done(task.host, 'check_ver'):
+        print(f"{task.host}: check_ver already done, resuming")
+        return
     sw_model = task.host['sw_model']
     # upgraded image to be used
-    desired = task.host[sw_model]['upgrade_version']
+    desired = model_data(task.host, sw_model)['upgrade_version']
     # record current software version
     current = task.host['current_version']
 
-    # compare current with desired version
-    if current == desired:
+    # compare current with desired version, newer releases are left alone
+    action = classify(current, desired, bool(task.host.get('allow_downgrade')))
+    task.host['version_action'] = action
+    if action == 'equal':
         c_print(f"*** {task.host}: running {current} upgrade NOT needed ***")
         # set host upgrade flag to False
         task.host['upgrade'] = False
+    elif action == 'newer':
+        c_print(f"*** {task.host}: running {current} newer than {desired}, skipped ***")
+        task.host['upgrade'] = False
     else:
-        c_print(f"*** {task.host}: running {current} must be upgraded ***")
+        c_print(f"*** {task.host}: running {current} must be {action}d ***")
         # set host upgrade flag to True
         task.host['upgrade'] = True
+        # IOS-XE stacks may already have the release installed
+        if is_xe(sw_model):
+            if flag_pending(task.host, desired):
+                c_print(f"*** {task.host}: {desired} installed, waiting for reload ***")
+                return
+        # make sure every member has room for the image before transferring
+        check_flash(task)
+
+
+# Exclude hosts without enough free flash on any stack member
+def check_flash(task):
+    sw_model = task.host['sw_model']
+    upgrade_img = model_data(task.host, sw_model)['upgrade_img']
+    size = image_size(task.host, upgrade_img)
+    shortfall = flash_shortfall(task.host.get('flash'), sw_model, size)
+
+    if shortfall is None:
+        c_print(f"*** {task.host}: flash space for {upgrade_img} NOT checked ***")
+    elif shortfall:
+        for member, missing in sorted(shortfall.items()):
+            print(f"{task.host}: {member} needs {mb(missing)} more free space")
+        c_print(f"*** {task.host}: not enough flash, upgrade skipped ***")
+        # set host upgrade flag to False so no bytes are transferred
+        task.host['upgrade'] = False
+        task.host['flash_ok'] = False
+        return
+    task.host['flash_ok'] = True
 
 
 # Stack upgrader main function
-def stack_upgrader(task):
+def stack_upgrader(task, cache=None):
+    # already done before the run was resumed
+    if done(task.host, 'stack_upgrader'):
+        print(f"{task.host}: stack_upgrader already done, resuming")
+        return
     sw_model = task.host['sw_model']
-    upgrade_img = task.host[sw_model]['upgrade_img']
+    # already installed, reload_sw activates it
+    if task.host.get('pending_reload'):
+        c_print(f"*** {task.host}: install pending reload, skipping install ***")
+        return
     if task.host['upgrade'] == True:
         # run function to upgrade
         c_print(f"*** {task.host}: Upgraging Catalyst {sw_model} software ***")
 
-        # upgrade commands based on switch hardware model 
-        if '3750' in sw_model:
-            cmd = f"archive download-sw /imageonly /allow-feature-upgrade /safe " + \
-                f"ftp://{task.host['ftp_ip']}/{upgrade_img}"
-
-        elif '3650' in sw_model or '3850' in sw_model:
-            if task.host['current_version'].startswith("16"):
-                cmd = f"request platform software package install switch all file " + \
-                    f"ftp://{task.host['ftp_ip']}/{upgrade_img} new auto-copy"
-            else:
-                cmd = f"archive download-sw /imageonly /allow-feature-upgrade /safe " + \
-                    f"ftp://{task.host['ftp_ip']}/{upgrade_img}"
-
-        elif '9300' in sw_model:
-                cmd = f"request platform software package install switch all file " + \
-                    f"ftp://{task.host['ftp_ip']}/{upgrade_img} on-reboot"
+        # install from a pre-staged image on flash when there is one,
+        # else the command from the upgrade plan or resolved from host facts
+        upgrade_img = model_data(task.host, sw_model)['upgrade_img']
+        url = staged_url(task, upgrade_img)
+        if url:
+            print(f"{task.host}: using staged image {url}")
+            cmd = upgrade_command(sw_model, task.host['current_version'], url)
+        else:
+            # SCP pushes the image to flash first, the install reads it there
+            if transport_for(task.host) == 'scp':
+                copy_image(task, 'scp', upgrade_img)
+            cmd = task.host.get('upgrade_cmd') or plan_host(task.host)['cmd']
+
+        print(cmd)
+        print()
 
-    print(cmd)
-    print()
+        # run upgrade command on switch stack, progress is printed as it
+        # streams and the task returns on the first success / error marker
+        task.run(
+            task=stream_command,
+            command_string=cmd,
+        )
+        # the cached install state is the one before this install, the
+        # caller saves the cache once the phase is over
+        if cache:
+            cache.drop(task.host.name)
+
+        # installed, free the flash the staged copy holds, it was checked
+        # against the image catalog when it was staged
+        if url:
+            remove_staged(task, upgrade_img)
+            task.host['md5_verified'] = True
+
+
+# Verify the image on flash against the image catalog
+def verify_image(task, catalog):
+    # already done before the run was resumed
+    if done(task.host, 'verify_image'):
+        print(f"{task.host}: verify_image already done, resuming")
+        return
+    sw_model = task.host['sw_model']
+    upgrade_img = model_data(task.host, sw_model)['upgrade_img']
+    # installed from a staged copy that was verified and then removed
+    if task.host.get('md5_verified'):
+        print(f"{task.host}: {upgrade_img} verified when staged")
+        return Result(host=task.host, result=None)
+    expected = catalog.md5(upgrade_img)
+    if expected is None:
+        print(f"{task.host}: {upgrade_img} not in image catalog, NOT verified")
+        return Result(host=task.host, result=None)
+
+    # only images kept on flash can be verified
+    listing = task.run(
+        task=netmiko_send_command,
+        command_string=f"dir flash:{upgrade_img}",
+    )
+    if upgrade_img not in listing.result or 'Error' in listing.result:
+        print(f"{task.host}: {upgrade_img} not on flash, NOT verified")
+        return Result(host=task.host, result=None)
 
-    # run upgrade command on switch stack
-    upgrade_sw = task.run(
+    # hash the image on the switch, this takes a while for large images
+    verify = task.run(
         task=netmiko_send_command,
-        use_timing=True,
-        command_string=cmd,
-        delay_factor=150,
-        #max_loops=1000
+        command_string=f"verify /md5 flash:{upgrade_img}",
+        delay_factor=6,
+    )
+    md5 = verify_md5(verify.result)
+    task.host['md5_verified'] = md5 == expected
+    print(f"{task.host}: {md5} verified = {task.host['md5_verified']}")
+    return Result(
+        host=task.host,
+        result=md5,
+        failed=not task.host['md5_verified'],
     )
-    # print upgrade results
-    statuses = ['error','installed','fail','success']
-    result = upgrade_sw.result.splitlines()
-    for line in result:
-        for status in statuses:
-            if status in line.lower():
-                print(f"{task.host}: {line}")
 
 
-# Reload switches
-def reload_sw(task):
+# Reload switches, cached facts for the host are dropped
+def reload_sw(task, cache=None):
+    # already done before the run was resumed
+    if done(task.host, 'reload_sw'):
+        print(f"{task.host}: reload_sw already done, resuming")
+        return
     # Check if upgrade reload needed
     if task.host['upgrade'] == True:
         c_print(f"*** {task.host} is reloading ***")
@@ -223,36 +463,376 @@ def reload_sw(task):
                 use_timing=True,
                 command_string="",
             )
+        # record reload time for the readiness poller
+        task.host['reload_time'] = time.time()
+        # the cached version is the one being replaced, the caller saves
+        # the cache once the phase is over
+        if cache:
+            cache.drop(task.host.name)
+
+
+# Run every phase for one host without waiting on the rest of the fleet
+def upgrade_pipeline(task, scheduler, upgrade_gate, reload_gate, catalog,
+                     cache=None, max_age=None, mirrors=None):
+    # gather switch info and compare versions
+    task.run(task=get_info, cache=cache, max_age=max_age)
+    task.run(task=check_ver)
+    if task.host['upgrade'] != True:
+        return
+
+    # wait for operator approval before moving any bytes
+    if not upgrade_gate.wait(task.host):
+        c_print(f"*** {task.host}: upgrade declined, skipping ***")
+        task.host['upgrade'] = False
+        return
+    # transfer and install inside a scheduler slot, a pending install needs none
+    if task.host.get('pending_reload'):
+        task.run(task=stack_upgrader, cache=cache)
+    else:
+        # pick the image mirror now, its connection cap applies to the slot
+        if mirrors and mirrors.assign(task.host):
+            print(f"{task.host}: pulling from mirror {task.host['image_server']}")
+        with scheduler.slot(task.host):
+            task.run(task=stack_upgrader, cache=cache)
+    # check the image hash before it is booted
+    task.run(task=verify_image, catalog=catalog)
+
+    # wait for operator approval before reloading
+    if not reload_gate.wait(task.host):
+        c_print(f"*** {task.host}: reload declined, skipping ***")
+        return
+    task.run(task=reload_sw, cache=cache)
+
+
+# Pipelined run, fast hosts transfer while slow hosts are still being checked
+def run_pipeline(nr, args, cache, max_age, catalog, gates=None, limit=None, num_workers=None,
+                 mirrors=None):
+    scheduler = UpgradeScheduler.from_inventory(nr, limit)
+    # gates are shared when several sites run at once
+    if gates is None:
+        gates = (
+            ApprovalGate('upgrade', args.approve, args.wave_size),
+            ApprovalGate('reload', args.approve, args.wave_size),
+        )
+    upgrade_gate, reload_gate = gates
+
+    c_print('Upgrading Catalyst switch stacks (pipelined)')
+    nr.run(
+        task=upgrade_pipeline,
+        num_workers=num_workers,
+        scheduler=scheduler,
+        upgrade_gate=upgrade_gate,
+        reload_gate=reload_gate,
+        catalog=catalog,
+        cache=cache,
+        max_age=max_age,
+        # mirrors are shared when several sites run at once
+        mirrors=mirrors or MirrorSelector(),
+    )
+    cache.save()
+    print('~'*80)
 
+    # wait for reloaded stacks and verify versions
+    reports = poll_reloaded(nr)
+    print('~'*80)
 
-def main():
-  
-    # run The Norn kickoff
-    nr = kickoff()
-    
+    # print failed hosts
+    c_print("*** Failed hosts: ***")
+    c_print(f"{nr.data.failed_hosts}")
+    print('~'*80)
+    return reports
+
+
+# image servers used by the hosts of a site
+def site_servers(nr):
+    servers = set()
+    for host in nr.inventory.hosts.values():
+        servers.add(host.get('image_server') or host.get('ftp_ip') or host.get('http_ip'))
+    return servers
+
+
+# Run several sites in parallel, each with its own inventory and image server
+def run_sites(args, timer, journal, cache, max_age):
+    sites = {}
+    # kickoff prompts for credentials, so load inventories one at a time
+    for i, site in enumerate(args.site):
+        c_print(f'Loading site {site}')
+        nr = kickoff(site)
+        # one start line in the shared journal for all sites
+        resume(nr, args, journal, start=i == 0)
+        nr = nr.with_processors([timer, journal])
+        servers = site_servers(nr)
+        if None in servers:
+            c_print(f'*** {site}: hosts without ftp_ip / http_ip, site skipped ***')
+            continue
+        c_print(f"{site}: {len(nr.inventory.hosts)} hosts, image server " +
+                ', '.join(sorted(servers)))
+        sites[site] = nr
+
+    # one set of approval prompts and one global transfer limit for all sites
+    gates = (
+        ApprovalGate('upgrade', args.approve, args.wave_size),
+        ApprovalGate('reload', args.approve, args.wave_size),
+    )
+    limit = threading.BoundedSemaphore(args.global_workers)
+    # one set of mirror probes and mirror loads for all sites
+    mirrors = MirrorSelector()
+
+    def _site(site, nr):
+        catalog = ImageCatalog(nr.inventory.defaults.data.get('image_dir') or 'images')
+        return run_pipeline(nr, args, cache, max_age, catalog, gates, limit, args.site_workers,
+                            mirrors)
+
+    with ThreadPoolExecutor(max_workers=len(sites) or 1) as pool:
+        futures = {site: pool.submit(_site, site, nr) for site, nr in sites.items()}
+        results = {site: future.result() for site, future in futures.items()}
+
+    # combined report
+    c_print('*** Multi-site report ***')
+    print(f"{'site':<20}{'hosts':>8}{'upgraded':>10}{'passed':>8}{'failed':>8}")
+    reports = []
+    for site, nr in sites.items():
+        site_reports = results[site]
+        reports.extend(site_reports)
+        passed = len([r for r in site_reports if r['status'] == 'pass'])
+        print(f"{site:<20}{len(nr.inventory.hosts):>8}{len(site_reports):>10}" +
+              f"{passed:>8}{len(nr.data.failed_hosts):>8}")
+    print('~'*80)
+    return reports
+
+
+# Restore completed phases from the journal with --resume, then mark the run start
+def resume(nr, args, journal, start=True):
+    if args.resume:
+        restored = journal.restore(nr)
+        c_print(f'Resuming {restored} hosts from {journal.path}')
+    if start:
+        journal.start(args.resume)
+
+
+# Record post-reload recovery time as its own phase
+def record_recovery(timer, reports):
+    for r in reports:
+        if r['minutes'] is not None:
+            timer.record(r['host'], 'recovery', r['minutes'] * 60, r['status'], model=r['model'])
+
+
+# Upgrade and reload one admitted host, checking the deadline at each step
+def deadline_upgrade(task, upgrade_gate, reload_gate, catalog, cache=None):
+    if not upgrade_gate.wait(task.host):
+        task.host['upgrade'] = False
+        return
+    task.run(task=stack_upgrader, cache=cache)
+    task.run(task=verify_image, catalog=catalog)
+    if not reload_gate.wait(task.host):
+        return
+    task.run(task=reload_sw, cache=cache)
+
+
+# Unattended run that admits hosts by estimated time left in the window
+def run_deadline(nr, args, catalog, cache=None):
+    scheduler = UpgradeScheduler.from_inventory(nr)
+    planner = DeadlinePlanner(
+        parse_window_end(args.window_end), scheduler, args.metrics)
+
+    # order by estimated upgrade time and admit what fits
+    upgrades = nr.filter(filter_func=lambda h: h.get('upgrade') == True)
+    admitted, skipped = planner.plan(upgrades.inventory.hosts.values())
+    c_print(f'{len(admitted)} stacks fit in the window, ' +
+            f'{planner.minutes_left():.0f} min left')
+    for name, reason in sorted(skipped.items()):
+        print(f"{name}: skipped, {reason}")
+    print('~'*80)
+
+    c_print('Upgrading Catalyst switch stacks (unattended)')
+    admitted_nr = upgrades.filter(filter_func=lambda h: h.name in admitted)
+    scheduler.run(
+        admitted_nr,
+        task=deadline_upgrade,
+        order=admitted,
+        upgrade_gate=DeadlineGate('upgrade', planner, UPGRADE_PHASES + RELOAD_PHASES),
+        reload_gate=DeadlineGate('reload', planner, RELOAD_PHASES),
+        catalog=catalog,
+        cache=cache,
+    )
+    if cache:
+        cache.save()
+    print('~'*80)
+
+    # wait for reloaded stacks and verify versions
+    reports = poll_reloaded(nr)
+    print('~'*80)
 
-    # gather switch info
-    c_print('Gathering device configurations')
-    # run The Norn to get info
-    nr.run(task=get_info)
     # print failed hosts
-    c_print(f"Failed hosts: {nr.data.failed_hosts}")
+    c_print("*** Failed hosts: ***")
+    c_print(f"{nr.data.failed_hosts}")
+    print('~'*80)
+    return reports
+
+
+# Copy images onto flash ahead of the window, throttled to --stage-workers
+def run_stage(nr, args, catalog):
+    upgrades = nr.filter(filter_func=lambda h: h.get('upgrade') == True)
+    scheduler = UpgradeScheduler.from_inventory(nr)
+    scheduler.max_workers = min(args.stage_workers, scheduler.max_workers)
+
+    c_print(f'Staging images on {len(upgrades.inventory.hosts)} stacks, ' +
+            f'{scheduler.max_workers} at a time')
+    proceed()
+    results = scheduler.run(upgrades, task=stage_image, catalog=catalog)
+    print('~'*80)
+
+    c_print('*** Staging report ***')
+    for name in sorted(upgrades.inventory.hosts):
+        host = upgrades.inventory.hosts[name]
+        if name in nr.data.failed_hosts:
+            print(f"{name}: staging FAILED")
+        else:
+            print(f"{name}: staged on {', '.join(host.get('staged') or [])}")
     print('~'*80)
+    return results
+
+
+# Upgrade, verify and reload one host of a wave
+def wave_upgrade(task, catalog, cache=None):
+    task.run(task=stack_upgrader, cache=cache)
+    task.run(task=verify_image, catalog=catalog)
+    task.run(task=reload_sw, cache=cache)
+
+
+# Canary / wave rollout with automatic halt on failure rate
+def run_waves(nr, args, catalog, cache=None):
+    upgrades = nr.filter(filter_func=lambda h: h.get('upgrade') == True)
+    waves = build_waves(
+        upgrades.inventory.hosts.values(), args.canary, args.growth, args.wave_by)
+    c_print(f'{len(waves)} waves: ' + ', '.join(str(len(w)) for w in waves))
+    proceed()
+
+    scheduler = UpgradeScheduler.from_inventory(nr)
+    reports = []
+    for i, wave in enumerate(waves):
+        wave_nr = upgrades.filter(filter_func=lambda h: h.name in wave)
+        # each wave gets its own scheduler, concurrency grows with the wave
+        wave_scheduler = UpgradeScheduler.from_inventory(nr)
+        wave_scheduler.max_workers = min(len(wave), scheduler.max_workers)
+
+        c_print(f'Wave {i + 1}/{len(waves)}: upgrading {len(wave)} stacks')
+        wave_scheduler.run(wave_nr, task=wave_upgrade, catalog=catalog, cache=cache)
+        if cache:
+            cache.save()
+        wave_reports = poll_reloaded(wave_nr)
+        reports.extend(wave_reports)
+
+        rate = failure_rate(wave, nr.data.failed_hosts, wave_reports)
+        c_print(f'Wave {i + 1} failure rate {rate:.0%}')
+        print('~'*80)
+        if rate > args.max_failure:
+            c_print(f'*** Failure rate above {args.max_failure:.0%}, halting rollout ***')
+            for name in [n for w in waves[i + 1:] for n in w]:
+                print(f"{name}: not upgraded, rollout halted")
+            break
 
-    # checking switch version
-    c_print('Checking switch software versions')
-    # run The Norn version check
-    nr.run(task=check_ver)
     # print failed hosts
-    c_print(f"Failed hosts: {nr.data.failed_hosts}")
+    c_print("*** Failed hosts: ***")
+    c_print(f"{nr.data.failed_hosts}")
     print('~'*80)
+    return reports
+
+
+def main():
+
+    args = get_args()
+    # time every task and subtask per host
+    timer = PhaseTimer(args.metrics)
+    # completed phases per host, read back by --resume
+    journal = PhaseJournal(args.journal)
+    # facts cache, --max-age is given in minutes
+    cache = FactsCache()
+    max_age = args.max_age * 60 if args.max_age is not None else None
+
+    # several sites at once, each runs the per host pipeline
+    if len(args.site) > 1:
+        reports = run_sites(args, timer, journal, cache, max_age)
+        record_recovery(timer, reports)
+        return
+
+    # run The Norn kickoff
+    nr = kickoff(args.site[0] if args.site else '')
+    resume(nr, args, journal)
+    nr = nr.with_processors([timer, journal])
+    # image checksums, only changed images are hashed
+    catalog = ImageCatalog(nr.inventory.defaults.data.get('image_dir') or 'images')
+
+    # per host pipeline mode
+    if args.pipeline:
+        reports = run_pipeline(nr, args, cache, max_age, catalog)
+        record_recovery(timer, reports)
+        return
+
+    # run a compiled plan, no per host checks needed
+    if args.plan:
+        c_print(f'Loading upgrade plan {args.plan}')
+        plan = load_plan(args.plan)
+        print_plan(plan)
+        nr = apply_plan(nr, plan)
+        print('~'*80)
+
+    else:
+        # gather switch info
+        c_print('Gathering device configurations')
+        # run The Norn to get info
+        nr.run(task=get_info, cache=cache, max_age=max_age)
+        cache.save()
+        # print failed hosts
+        c_print(f"Failed hosts: {nr.data.failed_hosts}")
+        print('~'*80)
+
+        # checking switch version
+        c_print('Checking switch software versions')
+        # run The Norn version check
+        nr.run(task=check_ver)
+        # print failed hosts
+        c_print(f"Failed hosts: {nr.data.failed_hosts}")
+        print('~'*80)
+
+        # pick the fastest image mirror for every host to upgrade, a plan
+        # already names the mirror its commands pull from
+        select_mirrors(nr)
+
+    # pre-stage images, the window run installs from flash
+    if args.stage:
+        run_stage(nr, args, catalog)
+        return
+
+    # canary and wave rollout
+    if args.waves:
+        reports = run_waves(nr, args, catalog, cache)
+        record_recovery(timer, reports)
+        return
+
+    # unattended run against the window end time
+    if args.window_end:
+        reports = run_deadline(nr, args, catalog, cache)
+        record_recovery(timer, reports)
+        return
 
    # upgrade switch software
     c_print('Upgrading Catalyst switch stack software')
     # prompt to proceed
     proceed()
-    # run The Norn model check
-    nr.run(task=stack_upgrader, num_workers=1)
+    # only schedule hosts flagged for upgrade
+    upgrades = nr.filter(filter_func=lambda h: h.get('upgrade') == True)
+    # run The Norn upgrade through the bandwidth aware scheduler
+    scheduler = UpgradeScheduler.from_inventory(nr)
+    scheduler.run(upgrades, task=stack_upgrader, cache=cache)
+    cache.save()
+    # print failed hosts
+    c_print(f"Failed hosts: {nr.data.failed_hosts}")
+    print('~'*80)
+
+    # verify image hashes on all upgraded stacks in parallel
+    c_print('Verifying image checksums')
+    upgrades.run(task=verify_image, catalog=catalog)
     # print failed hosts
     c_print(f"Failed hosts: {nr.data.failed_hosts}")
     print('~'*80)
@@ -262,7 +842,13 @@ def main():
     # prompt to proceed
     proceed()
     # run The Norn reload
-    nr.run(task=reload_sw)
+    nr.run(task=reload_sw, cache=cache)
+    cache.save()
+    print('~'*80)
+
+    # wait for reloaded stacks and verify versions
+    reports = poll_reloaded(nr)
+    record_recovery(timer, reports)
     print('~'*80)
 
     # print failed hosts
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+'''
+Pre-staging of upgrade images outside the maintenance window.
+
+stage_image copies the upgrade image onto the active member's flash, over
+the host's transport, and checks its MD5 against the image catalog, so no
+image bytes move over the WAN during the window. The image is pulled once
+per stack: archive download-sw and install switch all read it from flash:
+and copy it to the other members themselves. A host that already holds a
+verified copy is skipped, so a staging run can be repeated until every
+host is staged.
+
+The staged copy stays on flash until the window and the install then
+needs its usual headroom next to it, so the active member must have the
+image size plus the install headroom free before the copy starts. The other
+members only need the install headroom, which check_ver already checks.
+
+In the window, staged_url() finds the staged image on the active member's
+flash and the install command reads it from flash: instead of the image
+server:
+
+    archive download-sw /imageonly /allow-feature-upgrade /safe flash:c3750e-...tar
+    request platform software package install switch all file flash:cat9k_iosxe...bin on-reboot
+
+remove_staged() deletes the staged copy once the install succeeded.
+'''
+
+import re
+from nornir.core.task import Result
+from nornir.plugins.tasks.networking import netmiko_send_command
+from image_catalog import verify_md5
+from flash_check import parse_flash, image_size, space_needed, mb
+from plan import model_data
+from transports import transport_for, copy_image
+from journal import done
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+# free bytes on the active member's flash, None if it can not be read
+def active_free(task):
+    listing = task.run(
+        task=netmiko_send_command,
+        command_string="dir flash: | include bytes total",
+    )
+    return (parse_flash(listing.result).get('flash') or {}).get('free')
+
+
+# MD5 of an image on a flash filesystem, None if it is not there
+def member_md5(task, fs, upgrade_img):
+    verify = task.run(
+        task=netmiko_send_command,
+        command_string=f"verify /md5 {fs}:{upgrade_img}",
+        delay_factor=6,
+    )
+    return verify_md5(verify.result)
+
+
+# Copy and verify the upgrade image on the active member
+def stage_image(task, catalog):
+    # already done before the run was resumed
+    if done(task.host, 'stage_image'):
+        return
+    # nothing to stage when the release is installed and waits for a reload
+    if task.host['upgrade'] != True or task.host.get('pending_reload'):
+        return
+    upgrade_img = model_data(task.host, task.host['sw_model'])['upgrade_img']
+    expected = catalog.md5(upgrade_img)
+    if expected is None:
+        return Result(
+            host=task.host,
+            result=f'{upgrade_img} not in image catalog, can not stage',
+            failed=True,
+        )
+
+    # already staged by an earlier run
+    if member_md5(task, 'flash', upgrade_img) == expected:
+        print(f"{task.host}: flash:{upgrade_img} already staged")
+        task.host['staged'] = ['flash']
+        return Result(host=task.host, result=task.host['staged'])
+
+    # the staged copy plus room to install from it in the window
+    size = image_size(task.host, upgrade_img)
+    needed = size + space_needed(task.host['sw_model'], size) if size else None
+    free = active_free(task)
+    if needed is None or free is None:
+        print(f"{task.host}: flash space for staging NOT checked")
+    elif free < needed:
+        return Result(
+            host=task.host,
+            result=f'flash needs {mb(needed - free)} more free space to stage ' +
+                   f'{upgrade_img} and install from it',
+            failed=True,
+        )
+
+    c_print(f"*** {task.host}: staging {upgrade_img} on flash ***")
+    copy_image(task, transport_for(task.host), upgrade_img)
+    md5 = member_md5(task, 'flash', upgrade_img)
+    if md5 != expected:
+        return Result(
+            host=task.host,
+            result=f'flash:{upgrade_img} md5 {md5} does not match {expected}',
+            failed=True,
+        )
+
+    task.host['staged'] = ['flash']
+    return Result(host=task.host, result=task.host['staged'], changed=True)
+
+
+# flash: URL of a staged image on the active member, None if not staged
+def staged_url(task, upgrade_img):
+    listing = task.run(
+        task=netmiko_send_command,
+        command_string=f"dir flash:{upgrade_img}",
+    )
+    if 'Error' in listing.result:
+        return None
+    # "  12  -rw-  20633600  Mar 1 1993 00:10:15 +00:00  c3750e-...tar"
+    m = re.search(rf'-[rwxd-]+\s+(\d+)\s.*{re.escape(upgrade_img)}\s*$', listing.result, re.M)
+    if not m:
+        return None
+    # a partial copy left by an interrupted staging run is not used
+    size = image_size(task.host, upgrade_img)
+    if size is not None and int(m.group(1)) != size:
+        return None
+    return f"flash:{upgrade_img}"
+
+
+# Delete the staged copy once the install succeeded
+def remove_staged(task, upgrade_img):
+    task.run(
+        task=netmiko_send_command,
+        command_string=f"delete /force flash:{upgrade_img}",
+    )
+    task.host['staged'] = []
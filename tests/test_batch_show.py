@@ -0,0 +1,44 @@
+import re
+from batch_show import split_output, PAGING_CMD
+
+
+PROMPT = re.compile(r'^sw1[>#]', re.M)
+COMMANDS = [PAGING_CMD, 'show version', 'show boot',
+            'dir all-filesystems | include Directory of|bytes total']
+
+# one write, the echo of every command follows its prompt
+TEXT = (
+    'terminal length 0\r\n'
+    'sw1#show version\r\n'
+    'Cisco IOS Software, C3750E Software (C3750E-UNIVERSALK9-M), Version 15.2(4)E7, RELEASE SOFTWARE (fc2)\r\n'
+    'ROM: Bootstrap program is C3750E boot loader\r\n'
+    'sw1 uptime is 1 year, 2 weeks, 3 days, 4 hours, 5 minutes\r\n'
+    '\r\n'
+    'sw1#show boot\r\n'
+    'BOOT path-list      : flash:/c3750e-universalk9-mz.152-4.E7/c3750e-universalk9-mz.152-4.E7.bin\r\n'
+    'Config file         : flash:/config.text\r\n'
+    'sw1#dir all-filesystems | include Directory of|bytes total\r\n'
+    'Directory of flash:/\r\n'
+    '57931776 bytes total (30408192 bytes free)\r\n'
+    'sw1#'
+)
+
+
+def test_split_output():
+    outputs = split_output(TEXT, PROMPT, COMMANDS)
+    assert list(outputs) == COMMANDS
+    assert outputs[PAGING_CMD] == ''
+    assert outputs['show version'].splitlines()[0].startswith('Cisco IOS Software, C3750E')
+    assert outputs['show version'].splitlines()[-1].startswith('sw1 uptime is')
+    assert outputs['show boot'].splitlines() == [
+        'BOOT path-list      : flash:/c3750e-universalk9-mz.152-4.E7/c3750e-universalk9-mz.152-4.E7.bin',
+        'Config file         : flash:/config.text',
+    ]
+    assert outputs[COMMANDS[3]] == \
+        'Directory of flash:/\n57931776 bytes total (30408192 bytes free)'
+
+
+def test_split_output_bare_cr():
+    text = 'terminal length 0\rsw1#show clock\r*10:02:11.123 UTC Mon Mar 1 2021\rsw1#'
+    outputs = split_output(text, PROMPT, [PAGING_CMD, 'show clock'])
+    assert outputs['show clock'] == '*10:02:11.123 UTC Mon Mar 1 2021'
@@ -0,0 +1,94 @@
+import json
+from nornir.core.inventory import Host, Defaults, ParentGroups
+from scheduler import UpgradeScheduler
+from deadline import DeadlinePlanner, noop, parse_window_end
+
+
+NOW = 1000000.0
+
+
+def make_hosts(count, model='C3750X'):
+    defaults = Defaults()
+    return [Host(name=f'sw{i}', groups=ParentGroups(['site1']), defaults=defaults,
+                 data={'sw_model': model, 'ftp_ip': '10.0.0.1'})
+            for i in range(count)]
+
+
+def write_history(path, records):
+    with open(path, 'w') as f:
+        for r in records:
+            f.write(json.dumps(dict({'ts': 0, 'host': 'sw0', 'model': 'C3750X'}, **r)) + '\n')
+
+
+# 20 min install, 5 min verify, 1 min reload and the 20 min C3750X recovery
+HISTORY = [
+    {'phase': 'stack_upgrader', 'duration': 1200, 'outcome': 'changed', 'subtasks': 3},
+    {'phase': 'verify_image', 'duration': 300, 'outcome': 'ok', 'subtasks': 2},
+    {'phase': 'reload_sw', 'duration': 60, 'outcome': 'changed', 'subtasks': 3},
+    # no work done, left out of the estimates
+    {'phase': 'stack_upgrader', 'duration': 0.1, 'outcome': 'ok', 'subtasks': 1},
+    {'phase': 'verify_image', 'duration': 0.01, 'outcome': 'ok', 'subtasks': 0},
+    {'phase': 'reload_sw', 'duration': 5, 'outcome': 'failed', 'subtasks': 1},
+]
+
+
+def test_noop():
+    assert noop({'phase': 'verify_image', 'outcome': 'ok', 'subtasks': 0})
+    assert noop({'phase': 'stack_upgrader', 'outcome': 'ok', 'subtasks': 2})
+    assert not noop({'phase': 'stack_upgrader', 'outcome': 'changed', 'subtasks': 2})
+    # records written before subtasks were counted
+    assert not noop({'phase': 'verify_image', 'outcome': 'ok'})
+
+
+def test_estimates_skip_noop_records(tmp_path):
+    path = str(tmp_path / 'metrics.jsonl')
+    write_history(path, HISTORY)
+    planner = DeadlinePlanner(NOW + 3 * 3600, UpgradeScheduler(), path)
+    assert planner.estimate('C3750X', 'stack_upgrader') == 1200
+    assert planner.estimate('C3750X', 'verify_image') == 300
+    assert planner.estimate('C3750X', 'reload_sw') == 60
+    assert planner.total('C3750X') == 46 * 60
+    # no history, defaults
+    assert planner.estimate('C9300', 'stack_upgrader') == 30 * 60
+    assert planner.estimate('C9300', 'recovery') == 25 * 60
+
+
+def test_plan_follows_server_cap(tmp_path):
+    path = str(tmp_path / 'metrics.jsonl')
+    write_history(path, HISTORY)
+    # 2 at a time from one server, 46 min each: rounds end at 46, 92, 138
+    # and 184 min, the fourth round misses a 3 hour window
+    planner = DeadlinePlanner(NOW + 3 * 3600, UpgradeScheduler(server_cons=2), path)
+    admitted, skipped = planner.plan(make_hosts(8), now=NOW)
+    assert admitted == ['sw0', 'sw1', 'sw2', 'sw3', 'sw4', 'sw5']
+    assert sorted(skipped) == ['sw6', 'sw7']
+    assert 'after window' in skipped['sw6']
+
+
+def test_plan_without_caps_admits_all(tmp_path):
+    path = str(tmp_path / 'metrics.jsonl')
+    write_history(path, HISTORY)
+    planner = DeadlinePlanner(NOW + 3 * 3600, UpgradeScheduler(server_cons=8), path)
+    admitted, skipped = planner.plan(make_hosts(8), now=NOW)
+    assert len(admitted) == 8 and skipped == {}
+
+
+def test_plan_window_too_short():
+    planner = DeadlinePlanner(NOW + 30 * 60, UpgradeScheduler(), None)
+    admitted, skipped = planner.plan(make_hosts(2), now=NOW)
+    assert admitted == []
+    assert sorted(skipped) == ['sw0', 'sw1']
+
+
+def test_plan_does_not_change_the_scheduler(tmp_path):
+    scheduler = UpgradeScheduler(server_cons=2)
+    DeadlinePlanner(NOW + 3 * 3600, scheduler, None).plan(make_hosts(4), now=NOW)
+    assert scheduler.running == 0 and scheduler.server_use == {}
+
+
+def test_parse_window_end():
+    from datetime import datetime
+    now = datetime(2026, 10, 17, 22, 0)
+    assert parse_window_end('04:30', now) == datetime(2026, 10, 18, 4, 30).timestamp()
+    assert parse_window_end('23:00', now) == datetime(2026, 10, 17, 23, 0).timestamp()
+    assert parse_window_end('2026-10-18T05:00', now) == datetime(2026, 10, 18, 5, 0).timestamp()
@@ -0,0 +1,70 @@
+from flash_check import parse_flash, space_needed, flash_shortfall, RESERVE
+
+
+# dir all-filesystems | include Directory of|bytes total, 3750-X stack
+IOS_STACK = '''\
+Directory of flash:/
+57931776 bytes total (30408192 bytes free)
+Directory of flash1:/
+57931776 bytes total (30408192 bytes free)
+Directory of flash2:/
+57931776 bytes total (29829120 bytes free)
+Directory of nvram:/
+524288 bytes total (509405 bytes free)
+'''
+
+# the same on an IOS-XE 9300 stack
+XE_STACK = '''\
+Directory of crashinfo:/
+1651314688 bytes total (1546268672 bytes free)
+Directory of flash:/
+11353194496 bytes total (8838758400 bytes free)
+Directory of flash-1:/
+11353194496 bytes total (8838758400 bytes free)
+Directory of flash-2:/
+11353194496 bytes total (9112018944 bytes free)
+Directory of usbflash0:/
+0 bytes total (0 bytes free)
+'''
+
+# show flash: | include bytes on a single switch
+SINGLE = '''\
+122185728 bytes total (98381824 bytes free)
+'''
+
+
+def test_parse_ios_stack():
+    assert parse_flash(IOS_STACK) == {
+        'flash1': {'total': 57931776, 'free': 30408192},
+        'flash2': {'total': 57931776, 'free': 29829120},
+    }
+
+
+def test_parse_xe_stack():
+    assert parse_flash(XE_STACK) == {
+        'flash-1': {'total': 11353194496, 'free': 8838758400},
+        'flash-2': {'total': 11353194496, 'free': 9112018944},
+    }
+
+
+def test_parse_single_switch():
+    assert parse_flash(SINGLE) == {'flash': {'total': 122185728, 'free': 98381824}}
+
+
+def test_parse_empty():
+    assert parse_flash('') == {}
+
+
+def test_space_needed():
+    size = 20 * 1024 * 1024
+    assert space_needed('C3750X', size) == int(size * 1.1) + RESERVE
+    assert space_needed('C9300', size) == int(size * 2.2) + RESERVE
+
+
+def test_flash_shortfall():
+    flash = parse_flash(IOS_STACK)
+    assert flash_shortfall(flash, 'C3750X', 10 * 1024 * 1024) == {}
+    # needs 29999999 bytes, only flash2 is short
+    short = flash_shortfall(flash, 'C3750X', 17740218)
+    assert short == {'flash2': 29999999 - 29829120}
+    assert flash_shortfall(flash, 'C3750X', None) is None
@@ -0,0 +1,91 @@
+import threading
+import http.client
+import pytest
+from image_server import ImageRequestHandler, ImageHTTPServer
+
+
+SIZE = 1000
+
+
+def parse(header, size=SIZE):
+    handler = ImageRequestHandler.__new__(ImageRequestHandler)
+    handler.headers = {'Range': header} if header is not None else {}
+    return handler.parse_range(size)
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-499', (0, 499)),
+    ('bytes=500-999', (500, 999)),
+    # end past the file is cut to the last byte
+    ('bytes=900-5000', (900, 999)),
+    # open ended, resume from an offset
+    ('bytes=400-', (400, 999)),
+    # suffix, the last N bytes
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    # past the end, answered with 416
+    ('bytes=1000-', (1000, 999)),
+    ('bytes=-0', (1000, 999)),
+    ('bytes=600-500', (600, 500)),
+])
+def test_parse_range(header, expected):
+    assert parse(header) == expected
+
+
+@pytest.mark.parametrize('header', [None, '', 'bytes=-', 'bytes=0-1,5-9', 'items=0-1', 'bytes=a-b'])
+def test_parse_range_ignored(header):
+    assert parse(header) is None
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / 'img.bin').write_bytes(bytes(range(256)) * 4)
+    srv = ImageHTTPServer(('127.0.0.1', 0), str(tmp_path), max_clients=2)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv.server_address[1]
+    srv.shutdown()
+    srv.server_close()
+
+
+def get(port, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/img.bin', headers=headers or {})
+    resp = conn.getresponse()
+    body = resp.read()
+    conn.close()
+    return resp, body
+
+
+def test_full_download(server):
+    resp, body = get(server)
+    assert resp.status == 200
+    assert body == bytes(range(256)) * 4
+    assert resp.getheader('Accept-Ranges') == 'bytes'
+
+
+def test_range_download(server):
+    resp, body = get(server, {'Range': 'bytes=1000-'})
+    assert resp.status == 206
+    assert resp.getheader('Content-Range') == 'bytes 1000-1023/1024'
+    assert body == bytes(range(232, 256))
+
+
+def test_suffix_download(server):
+    resp, body = get(server, {'Range': 'bytes=-16'})
+    assert resp.status == 206
+    assert body == bytes(range(240, 256))
+
+
+def test_range_not_satisfiable(server):
+    resp, body = get(server, {'Range': 'bytes=1024-'})
+    assert resp.status == 416
+    assert resp.getheader('Content-Range') == 'bytes */1024'
+    assert body == b''
+
+
+def test_missing_file(server):
+    conn = http.client.HTTPConnection('127.0.0.1', server, timeout=10)
+    conn.request('GET', '/missing.bin')
+    assert conn.getresponse().status == 404
+    conn.close()
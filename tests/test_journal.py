@@ -0,0 +1,109 @@
+import json
+from types import SimpleNamespace
+from nornir.core.inventory import Host, Defaults
+from journal import PhaseJournal, done
+
+
+def make_host(name, **data):
+    return Host(name=name, data=data, defaults=Defaults())
+
+
+def make_nr(*hosts):
+    return SimpleNamespace(inventory=SimpleNamespace(hosts={h.name: h for h in hosts}))
+
+
+def lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_record_and_load(tmp_path):
+    journal = PhaseJournal(str(tmp_path / 'journal.jsonl'))
+    journal.start()
+    sw1 = make_host('sw1', sw_model='C3750X', current_version='15.2(4)E7', upgrade=True)
+    journal.record(sw1, 'get_info')
+    journal.record(sw1, 'check_ver')
+    # recorded again after a retry, listed once
+    journal.record(sw1, 'check_ver')
+    assert journal.load() == {'sw1': {
+        'phases': ['get_info', 'check_ver'],
+        'facts': {'sw_model': 'C3750X', 'current_version': '15.2(4)E7', 'upgrade': True},
+    }}
+
+
+def test_fresh_start_resets(tmp_path):
+    journal = PhaseJournal(str(tmp_path / 'journal.jsonl'))
+    journal.start()
+    journal.record(make_host('sw1', upgrade=True), 'get_info')
+    journal.start()
+    journal.record(make_host('sw2', upgrade=True), 'get_info')
+    assert list(journal.load()) == ['sw2']
+
+
+def test_resume_start_keeps_records(tmp_path):
+    journal = PhaseJournal(str(tmp_path / 'journal.jsonl'))
+    journal.start()
+    journal.record(make_host('sw1', upgrade=True), 'get_info')
+    journal.start(resume=True)
+    journal.record(make_host('sw1', upgrade=True), 'check_ver')
+    assert journal.load()['sw1']['phases'] == ['get_info', 'check_ver']
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    journal = PhaseJournal(str(path))
+    journal.start()
+    journal.record(make_host('sw1', upgrade=True), 'get_info')
+    with open(path, 'a') as f:
+        f.write('{"ts": 1, "host": "sw1", "pha')
+    assert journal.load()['sw1']['phases'] == ['get_info']
+
+
+def test_start_repairs_torn_line(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    journal = PhaseJournal(str(path))
+    journal.start()
+    journal.record(make_host('sw1', upgrade=True), 'get_info')
+    with open(path, 'a') as f:
+        f.write('{"ts": 1, "host": "sw1", "pha')
+    journal.start(resume=True)
+    journal.record(make_host('sw1', upgrade=True), 'check_ver')
+
+    # the start line is on its own line after the torn one
+    raw = path.read_text().splitlines()
+    assert raw[2] == '{"ts": 1, "host": "sw1", "pha'
+    assert json.loads(raw[3])['event'] == 'start'
+    assert journal.load()['sw1']['phases'] == ['get_info', 'check_ver']
+
+
+def test_start_on_empty_file(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    path.write_text('')
+    PhaseJournal(str(path)).start()
+    assert [line['event'] for line in lines(path)] == ['start']
+
+
+def test_restore(tmp_path):
+    journal = PhaseJournal(str(tmp_path / 'journal.jsonl'))
+    journal.start()
+    recorded = make_host('sw1', sw_model='C9300', current_version='16.6.5', upgrade=True,
+                         flash={'flash-1': {'total': 100, 'free': 50}})
+    journal.record(recorded, 'get_info')
+    journal.record(make_host('gone', upgrade=True), 'get_info')
+    recorded['md5_verified'] = True
+    journal.record(recorded, 'stack_upgrader')
+
+    sw1 = make_host('sw1')
+    assert journal.restore(make_nr(sw1, make_host('sw2'))) == 1
+    assert sw1['sw_model'] == 'C9300'
+    assert sw1['flash'] == {'flash-1': {'total': 100, 'free': 50}}
+    assert sw1['md5_verified'] is True
+    assert done(sw1, 'get_info') and done(sw1, 'stack_upgrader')
+    assert not done(sw1, 'reload_sw')
+
+
+def test_missing_journal(tmp_path):
+    journal = PhaseJournal(str(tmp_path / 'missing.jsonl'))
+    assert journal.load() == {}
+    sw1 = make_host('sw1')
+    assert journal.restore(make_nr(sw1)) == 0
+    assert not done(sw1, 'get_info')
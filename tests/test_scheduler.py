@@ -0,0 +1,148 @@
+import time
+import threading
+import pytest
+from nornir.core import Nornir
+from nornir.core.deserializer.configuration import Config
+from nornir.core.inventory import Inventory, Host, Hosts, Groups, Group, Defaults, ParentGroups
+from scheduler import UpgradeScheduler, Demand, check_cap
+
+
+def make_nr(specs, group_data=None):
+    defaults = Defaults()
+    groups = Groups({name: Group(name=name, data=data, defaults=defaults)
+                     for name, data in (group_data or {'site1': {}}).items()})
+    hosts = Hosts()
+    for name, data in specs:
+        site = data.pop('group', 'site1')
+        hosts[name] = Host(name=name, groups=ParentGroups([site]), defaults=defaults,
+                           data=dict({'ftp_ip': '10.0.0.1', 'sw_model': 'C3750X'}, **data))
+    inventory = Inventory(hosts=hosts, groups=groups, defaults=defaults)
+    return Nornir(inventory=inventory, config=Config.deserialize(logging={'enabled': False}))
+
+
+@pytest.mark.parametrize('cap', [0, -1, None, 1.5, '4'])
+def test_check_cap_rejects(cap):
+    with pytest.raises(ValueError):
+        check_cap('server_cons', cap)
+
+
+def test_check_cap_accepts():
+    check_cap('server_cons', 1)
+
+
+def test_caps_below_one_rejected():
+    with pytest.raises(ValueError):
+        UpgradeScheduler(max_workers=0)
+    with pytest.raises(ValueError):
+        UpgradeScheduler(model_cons={'C9300': 0})
+
+
+def test_demand_from_inventory():
+    nr = make_nr([('sw1', {'group': 'east', 'transfer_mbps': 50}),
+                  ('sw2', {'image_server': '10.9.9.9', 'image_server_cons': 3})],
+                 {'east': {}, 'site1': {}})
+    scheduler = UpgradeScheduler(server_cons=8, transfer_mbps=20)
+    sw1 = scheduler.demand(nr.inventory.hosts['sw1'])
+    assert (sw1.server, sw1.server_cons, sw1.site, sw1.model, sw1.mbps) == \
+        ('10.0.0.1', 8, 'east', 'C3750X', 50)
+    sw2 = scheduler.demand(nr.inventory.hosts['sw2'])
+    assert (sw2.server, sw2.server_cons, sw2.mbps) == ('10.9.9.9', 3, 20)
+
+
+def test_fits_server_cap():
+    scheduler = UpgradeScheduler(server_cons=2)
+    demand = Demand('sw', '10.0.0.1', 'site1', 'C3750X', 20, server_cons=2)
+    scheduler._take(demand)
+    assert scheduler._fits(demand)
+    scheduler._take(demand)
+    assert not scheduler._fits(demand)
+    # another server is not affected
+    assert scheduler._fits(Demand('sw', '10.0.0.2', 'site1', 'C3750X', 20, server_cons=2))
+
+
+def test_fits_model_and_worker_caps():
+    scheduler = UpgradeScheduler(max_workers=3, server_cons=8, model_cons={'C9300': 1})
+    c9300 = Demand('sw', '10.0.0.1', 'site1', 'C9300', 20, server_cons=8)
+    c3750 = Demand('sw', '10.0.0.1', 'site1', 'C3750X', 20, server_cons=8)
+    scheduler._take(c9300)
+    assert not scheduler._fits(c9300)
+    assert scheduler._fits(c3750)
+    scheduler._take(c3750)
+    scheduler._take(c3750)
+    assert not scheduler._fits(c3750)
+
+
+def test_fits_site_budget():
+    scheduler = UpgradeScheduler(server_cons=8, site_mbps=50)
+    demand = Demand('sw', '10.0.0.1', 'site1', 'C3750X', 20, server_cons=8)
+    scheduler._take(demand)
+    scheduler._take(demand)
+    assert not scheduler._fits(demand)
+    # host data budget wins over the scheduler default
+    assert scheduler._fits(demand, budget=60)
+    assert scheduler._fits(Demand('sw', '10.0.0.1', 'site2', 'C3750X', 20, server_cons=8))
+
+
+def test_undersized_site_budget_lets_one_through():
+    scheduler = UpgradeScheduler(server_cons=8, site_mbps=10)
+    demand = Demand('sw', '10.0.0.1', 'site1', 'C3750X', 20, server_cons=8)
+    assert scheduler._fits(demand)
+    scheduler._take(demand)
+    assert not scheduler._fits(demand)
+    scheduler._give(demand)
+    assert scheduler._fits(demand)
+
+
+def recorder(started, hold=0.0):
+    lock = threading.Lock()
+
+    def _task(task):
+        with lock:
+            started.append(task.host.name)
+        time.sleep(hold)
+        return task.host.name
+
+    return _task
+
+
+def test_run_every_host_once():
+    nr = make_nr([(f'sw{i}', {}) for i in range(12)])
+    started = []
+    results = UpgradeScheduler(max_workers=4, server_cons=4).run(nr, recorder(started))
+    assert sorted(results) == sorted(nr.inventory.hosts)
+    assert sorted(started) == sorted(nr.inventory.hosts)
+    assert all(not r.failed for r in results.values())
+
+
+def test_run_order():
+    nr = make_nr([(f'sw{i}', {}) for i in range(5)])
+    started = []
+    UpgradeScheduler(max_workers=1).run(nr, recorder(started), order=['sw3', 'sw1'])
+    assert started == ['sw3', 'sw1', 'sw0', 'sw2', 'sw4']
+
+
+def test_run_skips_blocked_hosts():
+    # sw1 waits for the only C9300 slot, sw2 starts ahead of it
+    nr = make_nr([('sw0', {'sw_model': 'C9300'}), ('sw1', {'sw_model': 'C9300'}),
+                  ('sw2', {})])
+    started = []
+    scheduler = UpgradeScheduler(max_workers=2, model_cons={'C9300': 1})
+    scheduler.run(nr, recorder(started, hold=0.2))
+    assert started == ['sw0', 'sw2', 'sw1']
+    assert scheduler.running == 0
+
+
+def test_run_worker_errors_raise():
+    nr = make_nr([('sw0', {})])
+    scheduler = UpgradeScheduler()
+    scheduler.limit = 'not a semaphore'
+    with pytest.raises(AttributeError):
+        scheduler.run(nr, recorder([]))
+
+
+def test_run_rejects_narrowed_cap():
+    nr = make_nr([('sw0', {})])
+    scheduler = UpgradeScheduler()
+    scheduler.max_workers = 0
+    with pytest.raises(ValueError):
+        scheduler.run(nr, recorder([]))
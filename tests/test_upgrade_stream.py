@@ -0,0 +1,113 @@
+import pytest
+from upgrade_stream import UpgradeStream, command_family, prompt_pattern
+
+
+def feed_lines(machine, lines):
+    events = []
+    for line in lines:
+        events.extend(machine.feed(line + '\r\n'))
+    return events
+
+
+@pytest.mark.parametrize('cmd, family', [
+    ('archive download-sw /overwrite /reload tftp://10.1.1.1/c3750e.tar', 'archive'),
+    ('request platform software package install switch all file flash:cat9k.bin', 'install'),
+    ('copy ftp://10.1.1.1/cat9k.bin flash:cat9k.bin', 'copy'),
+])
+def test_command_family(cmd, family):
+    assert command_family(cmd) == family
+
+
+def test_command_family_unknown():
+    with pytest.raises(ValueError):
+        command_family('show version')
+
+
+# progress lines that carry an error are errors
+@pytest.mark.parametrize('family, line', [
+    ('archive', 'Loading c3750e-universalk9-tar.152-4.E8.tar %Error reading '
+                'ftp://10.1.1.1/c3750e-universalk9-tar.152-4.E8.tar (No such file or directory)'),
+    ('archive', 'Installing (renaming): `flash:update/c3750e-universalk9-mz.152-4.E8\' -> '
+                '`flash:c3750e-universalk9-mz.152-4.E8\' failed'),
+    ('install', '[1]: FAILED: Install operation failed due to insufficient flash space'),
+    ('archive', 'examining image... ERROR: Image is not a valid IOS image archive.'),
+])
+def test_error_wins_over_progress(family, line):
+    machine = UpgradeStream(family)
+    assert feed_lines(machine, [line]) == [('error', line)]
+    assert machine.state == 'error'
+
+
+ARCHIVE = [
+    'sw1#archive download-sw /overwrite tftp://10.1.1.1/c3750e-universalk9-tar.152-4.E8.tar',
+    'Loading c3750e-universalk9-tar.152-4.E8.tar from 10.1.1.1 (via Vlan1): !!!!!!!!!!',
+    'examining image...',
+    'extracting info (110 bytes)',
+    'Installing c3750e-universalk9-mz.152-4.E8 ...',
+    'New software image installed in flash:c3750e-universalk9-mz.152-4.E8',
+    'All software images installed.',
+]
+
+
+def test_archive_success():
+    machine = UpgradeStream('archive')
+    events = feed_lines(machine, ARCHIVE)
+    assert machine.state == 'success'
+    assert [kind for kind, line in events] == ['progress'] * 5 + ['success']
+
+
+INSTALL = [
+    '--- Starting install_add_activate_commit ---',
+    'Performing install_add_activate_commit on all members',
+    '[1] Add package(s) on switch 1',
+    '[1] Finished Add on switch 1',
+    'Checking status of Add on [1]',
+    'Add: Passed on [1]',
+    'Finished Add',
+    'SUCCESS: install_add_activate_commit  Thu Mar  5 12:30:21 UTC 2020',
+]
+
+
+def test_install_success():
+    machine = UpgradeStream('install')
+    events = feed_lines(machine, INSTALL)
+    assert machine.state == 'success'
+    assert events[-1] == ('success', INSTALL[-1])
+
+
+def test_confirm_without_newline():
+    machine = UpgradeStream('copy')
+    events = machine.feed('Destination filename [cat9k.bin]? ')
+    assert events == [('confirm', 'Destination filename [cat9k.bin]?')]
+    assert machine.partial == ''
+
+
+def test_lines_split_across_reads():
+    machine = UpgradeStream('copy')
+    assert machine.feed('Accessing ftp://10.1.1.1/cat9k.bin...\r\n44830')
+    events = machine.feed('6184 bytes copied in 312.411 secs (143481 bytes/sec)\r\n')
+    assert events == [('success', '448306184 bytes copied in 312.411 secs (143481 bytes/sec)')]
+
+
+def test_prompt_without_marker_is_error():
+    machine = UpgradeStream('copy', prompt_pattern('sw1'))
+    machine.feed('Accessing ftp://10.1.1.1/cat9k.bin...\r\n')
+    events = machine.feed('sw1#')
+    assert machine.prompted
+    assert machine.state == 'error'
+    assert events[0][0] == 'error'
+
+
+def test_prompt_after_success():
+    machine = UpgradeStream('copy', prompt_pattern('sw1'))
+    machine.feed('448306184 bytes copied in 312.411 secs (143481 bytes/sec)\r\n')
+    assert machine.feed('sw1#') == []
+    assert machine.prompted
+    assert machine.state == 'success'
+
+
+def test_other_prompt_is_not_the_end():
+    machine = UpgradeStream('copy', prompt_pattern('sw1'))
+    machine.feed('sw10#\r\n')
+    assert not machine.prompted
+    assert machine.state == 'running'
@@ -0,0 +1,48 @@
+import pytest
+from versions import parse_version, classify, same_version
+
+
+@pytest.mark.parametrize('version, key', [
+    ('12.2(55)SE12', (12, 2, 55, '', 'SE', 12, '')),
+    ('15.2(4)E8', (15, 2, 4, '', 'E', 8, '')),
+    ('15.0(2a)EX5', (15, 0, 2, 'a', 'EX', 5, '')),
+    ('12.2(58)SE2a', (12, 2, 58, '', 'SE', 2, 'a')),
+    ('16.9.4', (16, 9, 4, '')),
+    ('16.09.04', (16, 9, 4, '')),
+    ('17.3.1a', (17, 3, 1, 'a')),
+])
+def test_parse_version(version, key):
+    assert parse_version(version) == key
+
+
+def test_parse_version_unknown():
+    assert parse_version('Denali 16.3') is None
+    assert parse_version('') is None
+    assert parse_version(None) is None
+
+
+@pytest.mark.parametrize('current, desired, action', [
+    ('12.2(55)SE11', '12.2(55)SE12', 'upgrade'),
+    # a plain string compare gets these two wrong
+    ('12.2(55)SE9', '12.2(55)SE12', 'upgrade'),
+    ('16.9.10', '16.9.4', 'newer'),
+    ('16.09.04', '16.9.4', 'equal'),
+    ('15.2(4)E8', '15.2(4)E7', 'newer'),
+    ('16.6.5', '16.9.4', 'upgrade'),
+])
+def test_classify(current, desired, action):
+    assert classify(current, desired) == action
+
+
+def test_classify_downgrade_allowed():
+    assert classify('16.12.4', '16.9.4', allow_downgrade=True) == 'downgrade'
+
+
+def test_classify_unknown_form():
+    assert classify('Everest', 'Everest') == 'equal'
+    assert classify('Everest', '16.6.5') == 'upgrade'
+
+
+def test_same_version():
+    assert same_version('16.09.04', '16.9.4')
+    assert not same_version('16.9.4', '16.9.5')
@@ -0,0 +1,43 @@
+from nornir.core.inventory import Host, Defaults, ParentGroups
+from waves import build_waves, failure_rate
+
+
+def make_hosts(sites):
+    defaults = Defaults()
+    return [Host(name=f'sw{i}', data={'site': site}, groups=ParentGroups([site]),
+                 defaults=defaults)
+            for i, site in enumerate(sites)]
+
+
+def test_count_waves():
+    hosts = make_hosts(['a'] * 10)
+    assert [len(w) for w in build_waves(hosts)] == [1, 2, 4, 3]
+    assert [len(w) for w in build_waves(hosts, canary=2, growth=3)] == [2, 6, 2]
+
+
+def test_waves_keep_order():
+    hosts = make_hosts(['a'] * 4)
+    assert build_waves(hosts) == [['sw0'], ['sw1', 'sw2'], ['sw3']]
+
+
+def test_growth_always_grows():
+    hosts = make_hosts(['a'] * 6)
+    assert [len(w) for w in build_waves(hosts, growth=1.0)] == [1, 2, 3]
+
+
+def test_site_waves_do_not_split_sites():
+    hosts = make_hosts(['a', 'b', 'b', 'c', 'c', 'c', 'd'])
+    assert build_waves(hosts, by='site') == [
+        ['sw0'], ['sw1', 'sw2', 'sw3', 'sw4', 'sw5'], ['sw6']]
+
+
+def test_group_waves():
+    hosts = make_hosts(['a', 'b', 'b', 'c'])
+    assert build_waves(hosts, by='group') == [['sw0'], ['sw1', 'sw2', 'sw3']]
+
+
+def test_failure_rate():
+    wave = ['sw0', 'sw1', 'sw2', 'sw3']
+    reports = [{'host': 'sw1', 'status': 'fail'}, {'host': 'sw2', 'status': 'pass'}]
+    assert failure_rate(wave, {'sw0'}, reports) == 0.5
+    assert failure_rate([], set(), []) == 0.0
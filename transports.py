@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+'''
+Image transports and per-model transport calibration.
+
+Renders the image source for each transport the switches can pull from,
+or pushes the image for SCP:
+
+    ftp     ftp://{ftp_ip}/{img}
+    http    http://{http_ip}:{http_port}/{img}      (image_server.py, port 8000)
+    tftp    tftp://{tftp_ip}/{img}
+    scp     pushed to flash by push.py (resumable SFTP, SCP fallback), installed
+            from flash:{img}
+
+An assigned mirror (image_server, and image_server_port for http) replaces
+the server address for the pull transports. The transport for a host is, in order: 'transport' in inventory
+data, the calibrated default for its model, then ftp.
+
+Calibration copies a small image over every transport to one switch per
+model, times it, deletes the copy and stores the fastest working transport
+per model. The copy output is polled every CALIBRATE_POLL seconds so a
+short copy is not rounded to whole seconds, and a transport that fails is
+recorded as unusable without failing the host:
+
+    python3 transports.py [site] [--image calibrate.bin] [--out transports.json]
+'''
+
+import os
+import json
+import time
+import argparse
+from functools import lru_cache
+from nornir.core.exceptions import NornirSubTaskError
+from nornir.plugins.tasks.networking import netmiko_send_command
+from upgrade_stream import stream_command
+from push import push_image
+
+
+CALIBRATION_FILE = 'transports.json'
+DEFAULT_TRANSPORT = 'ftp'
+
+# URL template and inventory key of the server address per pull transport
+PULL = {
+    'ftp': ('ftp://{server}/{img}', 'ftp_ip'),
+    'http': ('http://{server}:{port}/{img}', 'http_ip'),
+    'tftp': ('tftp://{server}/{img}', 'tftp_ip'),
+}
+TRANSPORTS = ['ftp', 'http', 'tftp', 'scp']
+HTTP_PORT = 8000
+# seconds between channel reads while timing a calibration copy
+CALIBRATE_POLL = 0.05
+
+
+# Print formatting function
+def c_print(printme):
+    # Print centered text with newline before and after
+    print(f"\n" + printme.center(80, ' ') + "\n")
+
+
+# calibrated default transport per model, {} if never calibrated
+@lru_cache(maxsize=None)
+def calibrated(path=CALIBRATION_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get('defaults', {})
+
+
+# transport used for a host
+def transport_for(host):
+    return host.get('transport') or \
+        calibrated().get(host.get('sw_model')) or DEFAULT_TRANSPORT
+
+
+# image source for a transport, a flash: path for pushed images
+def transport_url(host, transport, img):
+    if transport == 'scp':
+        return f"flash:{img}"
+    template, key = PULL[transport]
+    server = host.get('image_server') or host[key]
+    # an assigned http mirror may listen on its own port
+    port = (host.get('image_server') and host.get('image_server_port')) or \
+        host.get('http_port') or HTTP_PORT
+    return template.format(server=server, port=port, img=img)
+
+
+# Put an image on a flash filesystem over a transport
+def copy_image(task, transport, img, fs='flash', poll=1.0):
+    if transport == 'scp':
+        return task.run(task=push_image, img=img, fs=fs)
+    return task.run(
+        task=stream_command,
+        command_string=f"copy {transport_url(task.host, transport, img)} {fs}:{img}",
+        poll=poll,
+    )
+
+
+# Time a small copy over every transport on one switch
+def calibrate_host(task, img, transports=TRANSPORTS, poll=CALIBRATE_POLL):
+    times = {}
+    for transport in transports:
+        kept = len(task.results)
+        started = time.monotonic()
+        try:
+            copy_image(task, transport, img, poll=poll)
+            times[transport] = round(time.monotonic() - started, 2)
+        except (NornirSubTaskError, KeyError):
+            # transport not configured for this host or the copy failed, an
+            # answer for the calibration and not a failure of the host
+            times[transport] = None
+            del task.results[kept:]
+        task.run(
+            task=netmiko_send_command,
+            command_string=f"delete /force flash:{img}",
+        )
+    task.host['calibration'] = times
+    return times
+
+
+# fastest working transport per model
+def pick_defaults(results):
+    defaults = {}
+    for model, times in results.items():
+        working = {t: s for t, s in times.items() if s is not None}
+        if working:
+            defaults[model] = min(working, key=working.get)
+    return defaults
+
+
+def main():
+    # imported here so the transport helpers load without the upgrader
+    from stack_upgrader import kickoff, get_info
+
+    parser = argparse.ArgumentParser(description='Calibrate image transports per model')
+    parser.add_argument('site', nargs='?', default='',
+        help='inventory site prefix, loads inventory/{site}_hosts.yaml')
+    parser.add_argument('--image', default='calibrate.bin',
+        help='small image on every image server and in the local image directory')
+    parser.add_argument('--out', default=CALIBRATION_FILE, help='calibration file to write')
+    args = parser.parse_args()
+
+    nr = kickoff(args.site)
+    c_print('Gathering switch models')
+    nr.run(task=get_info)
+
+    # one switch per model
+    samples = {}
+    for name, host in nr.inventory.hosts.items():
+        if host.get('sw_model') and name not in nr.data.failed_hosts:
+            samples.setdefault(host['sw_model'], name)
+    picked = nr.filter(filter_func=lambda h: h.name in samples.values())
+
+    c_print(f'Calibrating {len(TRANSPORTS)} transports on {len(samples)} models')
+    picked.run(task=calibrate_host, img=args.image)
+
+    results = {model: nr.inventory.hosts[name].get('calibration') or {}
+               for model, name in samples.items()}
+    defaults = pick_defaults(results)
+
+    print(f"{'model':<12}" + ''.join(f'{t:>10}' for t in TRANSPORTS) + f"{'default':>10}")
+    for model, times in sorted(results.items()):
+        cells = ''.join(f"{times.get(t) if times.get(t) is not None else '-':>10}"
+                        for t in TRANSPORTS)
+        print(f"{model:<12}{cells}{defaults.get(model, '-'):>10}")
+
+    with open(args.out, 'w') as f:
+        json.dump({'created': time.time(), 'results': results, 'defaults': defaults},
+                  f, indent=2, sort_keys=True)
+    c_print(f'Calibration written to {args.out}')
+    print('~'*80)
+
+
+if __name__ == "__main__":
+    main()
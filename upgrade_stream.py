@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+'''
+Streaming parser for switch upgrade output.
+
+The install command is written to the netmiko channel and the output is fed
+line by line through a compiled pattern state machine for its command family:
+
+    archive   - archive download-sw (IOS 12.2 / 15.x)
+    install   - request platform software package install (IOS-XE 16.x)
+    copy      - copy of the image to flash when pre-staging
+
+Each line is tried against the error, success, confirm and progress
+patterns in that order, so a progress line carrying an error ("Loading ...
+%Error reading ...") is an error. Each matching line is emitted as an event
+and the task returns as soon as a terminal success or error marker is seen,
+or the device prompt comes back without one, instead of waiting for the
+output to go quiet.
+'''
+
+import re
+import time
+from nornir.core.task import Result
+
+
+# Event kinds in the order they are tried, errors win over success
+KINDS = ['error', 'success', 'confirm', 'progress']
+
+# Line patterns per command family
+FAMILIES = {
+    'archive': {
+        'error': [
+            r'%\s*Error',
+            r'ERROR:',
+            r'%\s*Failed',
+            r'failed',
+            r'not enough (free )?space',
+            r'Insufficient',
+            r'Aborting',
+        ],
+        'success': [
+            r'All software images installed',
+        ],
+        'confirm': [
+            r'\[confirm\]',
+        ],
+        'progress': [
+            r'^Loading ',
+            r'examining image',
+            r'^extracting ',
+            r'Installing ',
+            r'Deleting ',
+            r'New software image installed in',
+            r'Setting the system boot path',
+        ],
+    },
+    'install': {
+        'error': [
+            r'FAILED:',
+            r'ERROR:',
+            r'%\s*Error',
+            r'Insufficient',
+        ],
+        'success': [
+            r'SUCCESS: Software provisioned',
+            r'SUCCESS: Finished install',
+            r'SUCCESS: install_add_activate_commit',
+        ],
+        'confirm': [
+            r'\[y/n\]',
+            r'\[yes/no\]',
+        ],
+        'progress': [
+            r'^Copying ',
+            r'Verifying image',
+            r'Preparing ',
+            r'Finished ',
+            r'Installing ',
+            r'Checking ',
+            r'Committing ',
+            r'Activating ',
+            r'^\[\d+\]:',
+        ],
+    },
+    'copy': {
+        'error': [
+            r'%\s*Error',
+            r'Error opening',
+            r'No such file',
+            r'Not enough space',
+            r'Insufficient',
+        ],
+        'success': [
+            r'\d+ bytes copied in',
+        ],
+        'confirm': [
+            r'Destination filename \[',
+            r'over\s*write\?',
+        ],
+        'progress': [
+            r'^Accessing ',
+            r'^Loading ',
+        ],
+    },
+}
+
+# Answer to confirmation prompts per family, copy keeps the default file name
+ANSWERS = {
+    'archive': 'y',
+    'install': 'y',
+    'copy': '',
+}
+
+
+# Compile each family once, one alternation per kind in KINDS order
+def _compile(family):
+    return [(kind, re.compile('|'.join(family[kind]), re.IGNORECASE)) for kind in KINDS]
+
+
+PATTERNS = {name: _compile(family) for name, family in FAMILIES.items()}
+
+
+# Pick the command family from the install command
+def command_family(cmd):
+    if cmd.startswith('archive download-sw'):
+        return 'archive'
+    if cmd.startswith('request platform software package install'):
+        return 'install'
+    if cmd.startswith('copy '):
+        return 'copy'
+    raise ValueError(f'no upgrade output parser for command: {cmd}')
+
+
+# regex for a line that is only the device prompt
+def prompt_pattern(base_prompt):
+    return re.compile(rf'^{re.escape(base_prompt)}[>#]\s*$')
+
+
+# Pattern state machine for one command run
+class UpgradeStream(object):
+    def __init__(self, family, prompt=None):
+        self.patterns = PATTERNS[family]
+        self.prompt = prompt
+        self.prompted = False
+        self.partial = ''
+        self.state = 'running'
+        self.output = []
+
+    @property
+    def done(self):
+        return self.state in ('success', 'error')
+
+    # classify a single line, first kind in KINDS order wins
+    def _match(self, line):
+        for kind, pattern in self.patterns:
+            if pattern.search(line):
+                return (kind, line.strip())
+        return None
+
+    # the prompt came back, the command is over
+    def _at_prompt(self, line):
+        if not self.prompt or not self.prompt.match(line.strip()):
+            return None
+        self.prompted = True
+        if self.done:
+            return None
+        self.state = 'error'
+        return ('error', f'{line.strip()} prompt returned without a completion marker')
+
+    # feed raw channel data, returns the events found in it
+    def feed(self, data):
+        events = []
+        lines = (self.partial + data).split('\n')
+        # keep the unterminated tail for the next read
+        self.partial = lines.pop()
+        for line in lines:
+            line = line.rstrip('\r')
+            self.output.append(line)
+            event = self._at_prompt(line)
+            if event:
+                events.append(event)
+            if self.done:
+                continue
+            event = self._match(line)
+            if event:
+                events.append(event)
+                if event[0] in ('success', 'error'):
+                    self.state = event[0]
+        # confirmation prompts and the device prompt do not end with a newline
+        if self.partial:
+            event = self._at_prompt(self.partial)
+            if not event and not self.done:
+                event = self._match(self.partial)
+                if event and event[0] != 'confirm':
+                    event = None
+            if event or self.prompted:
+                self.output.append(self.partial)
+                self.partial = ''
+            if event:
+                events.append(event)
+        return events
+
+
+# print progress events as they arrive
+def print_event(host, kind, line):
+    print(f"{host}: {line}")
+
+
+# Nornir task, send an upgrade command and stream its output
+def stream_command(task, command_string, timeout=5400, poll=1.0, on_event=print_event):
+    conn = task.host.get_connection("netmiko", task.nornir.config)
+    family = command_family(command_string)
+    machine = UpgradeStream(family, prompt_pattern(conn.base_prompt))
+
+    conn.clear_buffer()
+    conn.write_channel(command_string + conn.RETURN)
+
+    deadline = time.monotonic() + timeout
+    while not machine.done and time.monotonic() < deadline:
+        data = conn.read_channel()
+        if not data:
+            time.sleep(poll)
+            continue
+        for kind, line in machine.feed(data):
+            on_event(task.host, kind, line)
+            # answer confirmation prompts the same way reload_sw does
+            if kind == 'confirm':
+                conn.write_channel(ANSWERS[family] + conn.RETURN)
+
+    if not machine.done:
+        machine.output.append(f'*** no completion marker after {timeout} seconds ***')
+        machine.state = 'error'
+    else:
+        # drain the rest of the output up to the prompt
+        drain = time.monotonic() + 30
+        while not machine.prompted and time.monotonic() < drain:
+            data = conn.read_channel()
+            if not data:
+                time.sleep(poll)
+                continue
+            machine.feed(data)
+    if machine.partial:
+        machine.output.append(machine.partial)
+
+    return Result(
+        host=task.host,
+        result='\n'.join(machine.output),
+        failed=machine.state == 'error',
+        changed=machine.state == 'success',
+    )
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+'''
+Cisco software version ordering.
+
+Parses IOS and IOS-XE version strings into comparable keys so check_ver
+compares versions instead of raw strings:
+
+    12.2(55)SE12    -> (12, 2, 55, '', 'SE', 12, '')
+    15.2(4)E8       -> (15, 2, 4, '', 'E', 8, '')
+    16.9.4 / 16.09.04 -> (16, 9, 4, '')
+
+Parsing is cached per distinct string, so a fleet with a handful of
+versions parses each of them once. classify() gives the action for a host:
+
+    upgrade    current is older than desired
+    equal      already on desired, 16.09.04 and 16.9.4 are equal
+    newer      current is newer than desired, skipped
+    downgrade  current is newer and the inventory allows downgrades
+
+Optional inventory data (defaults, group or host level):
+
+allow_downgrade: true
+'''
+
+import re
+from functools import lru_cache
+
+
+# 12.2(55)SE12, 15.2(4)E8, 15.0(2a)EX5, 12.2(58)SE2a
+IOS_RE = re.compile(
+    r'^(\d+)\.(\d+)\((\d+)([a-z]?)\)([A-Z]*)(\d*)([a-z]?)$')
+# 16.9.4, 16.09.04, 17.3.1a
+XE_RE = re.compile(r'^(\d+)\.(\d+)\.(\d+)([a-z]?)$')
+
+ACTIONS = ('upgrade', 'equal', 'newer', 'downgrade')
+
+
+# comparable key for a version string, None if it is not a known form
+@lru_cache(maxsize=None)
+def parse_version(version):
+    version = (version or '').strip()
+    m = XE_RE.match(version)
+    if m:
+        return (int(m.group(1)), int(m.group(2)), int(m.group(3)), m.group(4))
+    m = IOS_RE.match(version)
+    if m:
+        major, minor, release, rel_letter, train, rebuild, letter = m.groups()
+        return (int(major), int(minor), int(release), rel_letter,
+                train, int(rebuild or 0), letter)
+    return None
+
+
+# action for a host running current when desired is wanted
+def classify(current, desired, allow_downgrade=False):
+    have = parse_version(current)
+    want = parse_version(desired)
+    # unknown forms fall back to comparing the strings
+    if have is None or want is None:
+        return 'equal' if current == desired else 'upgrade'
+    if have == want:
+        return 'equal'
+    if have < want:
+        return 'upgrade'
+    return 'downgrade' if allow_downgrade else 'newer'
+
+
+# True if two version strings are the same release
+def same_version(a, b):
+    return classify(a, b) == 'equal'
+
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+'''
+Canary / wave rollout planning.
+
+Hosts that need an upgrade are split into waves: a small canary wave, then
+waves that grow geometrically. Waves are built from a host count or from
+whole sites / inventory groups so a site is never split across waves.
+Each wave is upgraded, reloaded and version checked before the next one
+starts, and the rollout halts when a wave's failure rate is too high.
+'''
+
+import math
+
+
+# key a host is grouped by for site / group waves
+def wave_key(host, by):
+    if by == 'site':
+        return host.get('site') or 'default'
+    if by == 'group':
+        return host.groups[0] if host.groups else 'default'
+    return host.name
+
+
+# split hosts into a canary wave and geometrically growing waves,
+# returns a list of lists of host names
+def build_waves(hosts, canary=1, growth=2.0, by='count'):
+    # units are single hosts or whole sites / groups, in inventory order
+    units = {}
+    for host in hosts:
+        units.setdefault(wave_key(host, by), []).append(host.name)
+    units = list(units.values())
+
+    waves = []
+    size = max(1, canary)
+    while units:
+        wave = []
+        for unit in units[:size]:
+            wave.extend(unit)
+        waves.append(wave)
+        units = units[size:]
+        size = max(size + 1, int(math.ceil(size * growth)))
+    return waves
+
+
+# share of a wave that failed a task or the post-reload version check
+def failure_rate(wave, failed_hosts, reports):
+    failed = set(wave) & set(failed_hosts)
+    failed |= {r['host'] for r in reports if r['status'] != 'pass'}
+    return len(failed) / len(wave) if wave else 0.0